@@ -5,6 +5,7 @@
 import re
 import tempfile
 from datetime import datetime
+from functools import lru_cache
 
 from api_integration.application.dtos import (
     DatosExtraidosPDF,
@@ -1162,10 +1163,19 @@ def _extract_text_from_pdf(pdf_data, logger):
         return None
 
 
+# Tipo de garantía entre comillas simples dentro de los mensajes técnicos
+_TIPO_GARANTIA_CORREO_RE = re.compile(r"garantía\s+'([^']+)'", re.IGNORECASE)
+_TIPO_GARANTIA_PDF_RE = re.compile(r"garantía del pdf:\s+'([^']+)'", re.IGNORECASE)
+
+
+@lru_cache(maxsize=32)
 def _traducir_mensaje_garantia_usuario(msg_garantia):
     """
     Traduce mensajes técnicos de garantía a mensajes amigables para el usuario
 
+    El mismo mensaje se traduce para la respuesta al remitente y para las
+    notificaciones CC; la caché evita repetir las búsquedas.
+
     Args:
         msg_garantia: Mensaje técnico de garantía (ej: "Garantía 'Normal' detectada en correo, pero sin fecha de compra → 'Sin Garantía'")
 
@@ -1180,7 +1190,7 @@ def _traducir_mensaje_garantia_usuario(msg_garantia):
     # Casos de garantía detectada en correo
     if "detectada en correo" in msg_lower or "detectada en cuerpo del correo" in msg_lower:
         # Extraer el tipo de garantía (puede estar entre comillas simples)
-        tipo_garantia_match = re.search(r"garantía\s+'([^']+)'", msg_garantia, re.IGNORECASE)
+        tipo_garantia_match = _TIPO_GARANTIA_CORREO_RE.search(msg_garantia)
         tipo_garantia = tipo_garantia_match.group(1) if tipo_garantia_match else "especificada"
 
         if "sin fecha de compra" in msg_lower:
@@ -1208,13 +1218,13 @@ def _traducir_mensaje_garantia_usuario(msg_garantia):
 
     # Caso de garantía del PDF ajustada a DAP
     if "garantía del pdf" in msg_lower and "ajustada a dap" in msg_lower:
-        tipo_garantia_match = re.search(r"garantía del pdf:\s+'([^']+)'", msg_garantia, re.IGNORECASE)
+        tipo_garantia_match = _TIPO_GARANTIA_PDF_RE.search(msg_garantia)
         tipo_garantia = tipo_garantia_match.group(1) if tipo_garantia_match else "la especificada"
         return f"La garantía del documento ({tipo_garantia}) se ajustó automáticamente a DAP porque la fecha de compra es menor a 7 días. Si necesita realizar algún cambio, por favor contáctese con soporte técnico de Fruno."
 
     # Caso de garantía del PDF (normal, sin ajustes)
     if "garantía del pdf:" in msg_lower:
-        tipo_garantia_match = re.search(r"garantía del pdf:\s+'([^']+)'", msg_garantia, re.IGNORECASE)
+        tipo_garantia_match = _TIPO_GARANTIA_PDF_RE.search(msg_garantia)
         tipo_garantia = tipo_garantia_match.group(1) if tipo_garantia_match else "especificada"
         return f"Se procesó la garantía {tipo_garantia} del documento. Si necesita realizar algún cambio, por favor contáctese con soporte técnico de Fruno."
 
@@ -1889,8 +1899,19 @@ class Case(BaseCase):
 
             pdf_attachment = pdf_attachments[0]  # Solo hay 1 PDF en este punto
             pdf_content = pdf_attachment.get('data')
+            if pdf_content is None and pdf_attachment.get('path'):
+                # email_manager guarda los adjuntos en archivos temporales
+                with open(pdf_attachment['path'], 'rb') as f:
+                    pdf_content = f.read()
             pdf_filename = pdf_attachment.get('filename', 'documento.pdf')
 
+            # PDF original para adjuntar en notificaciones a usuarios CC: si está en disco se
+            # pasa la ruta y email_manager lo codifica leyendo el archivo por bloques
+            if pdf_attachment.get('path'):
+                pdf_original = {'filename': pdf_filename, 'path': pdf_attachment['path']}
+            else:
+                pdf_original = {'filename': pdf_filename, 'data': pdf_content}
+
             logger.info(f"Procesando PDF: {pdf_filename}")
 
             # Normalizar el cuerpo del correo
@@ -1971,10 +1992,7 @@ class Case(BaseCase):
                             first_conflict.get('numero_transaccion')
                         ),
                         'extracted_data': extracted_data,  # Datos extraídos para usuarios CC
-                        'pdf_original': {  # PDF original para adjuntar en notificaciones a usuarios CC
-                            'filename': pdf_filename,
-                            'data': pdf_content
-                        }
+                        'pdf_original': pdf_original  # PDF original para adjuntar en notificaciones a usuarios CC
                     }
                     return response
 
@@ -1984,10 +2002,7 @@ class Case(BaseCase):
                     'subject': f"Error en Procesamiento de Preingreso - {timestamp}",
                     'body': _generate_all_failed_message(failed_files, non_pdf_files, subject),
                     'extracted_data': extracted_data,  # Datos extraídos para usuarios CC
-                    'pdf_original': {  # PDF original para adjuntar en notificaciones a usuarios CC
-                        'filename': pdf_filename,
-                        'data': pdf_content
-                    }
+                    'pdf_original': pdf_original  # PDF original para adjuntar en notificaciones a usuarios CC
                 }
                 return response
 
@@ -2020,10 +2035,7 @@ class Case(BaseCase):
                 'attachments': [],  # No enviamos archivos adjuntos en el correo principal
                 'extracted_data': extracted_data,  # Datos extraídos para usuarios CC
                 'preingreso_results': preingreso_results,  # Resultados del preingreso para usuarios CC
-                'pdf_original': {  # PDF original para adjuntar en notificaciones a usuarios CC
-                    'filename': pdf_filename,
-                    'data': pdf_content
-                }
+                'pdf_original': pdf_original  # PDF original para adjuntar en notificaciones a usuarios CC
             }
 
             logger.info("Procesamiento completado: 1 preingreso creado exitosamente")
@@ -2,7 +2,10 @@
 # Ubicación: raíz del proyecto.
 # Descripción: Manejador principal para cargar y ejecutar casos de respuesta automática
 
+import logging
+import re
 import sys
+from functools import lru_cache
 
 # Importar casos explícitamente (necesario para PyInstaller)
 try:
@@ -16,6 +19,62 @@ except ImportError as e:
     print(f"[DEBUG CaseHandler] ⚠️ Error al importar casos: {e}")
     AVAILABLE_CASES = {}
 
+# Logger del módulo para los errores al preparar la coincidencia de casos
+_log = logging.getLogger(__name__)
+
+# El remitente puede venir como "Nombre <email@domain.com>" o "email@domain.com"
+_SENDER_EMAIL_RE = re.compile(r'[\w\.-]+@[\w\.-]+')
+
+
+def _sender_domain(sender):
+    """Devuelve el dominio del remitente en minúsculas con '@' ('@fruno.com') o None"""
+    if not sender or '@' not in sender:
+        return None
+    email_match = _SENDER_EMAIL_RE.search(sender)
+    if not email_match:
+        return None
+    return '@' + email_match.group(0).split('@')[1].lower()
+
+
+@lru_cache(maxsize=8)
+def _parse_allowed_domains(allowed_domains):
+    """Convierte "@fruno.com, @unicomer.com" en un frozenset de dominios en minúsculas"""
+    if not allowed_domains or not allowed_domains.strip():
+        return frozenset()
+    return frozenset(d.strip().lower() for d in allowed_domains.split(',') if d.strip())
+
+
+class CaseMatcher:
+    """
+    Coincidencia de casos precalculada para un ciclo de revisión
+
+    Reúne las palabras clave de los casos y los dominios permitidos ya normalizados,
+    para no repetir ese trabajo por cada correo. Primero se busca una palabra clave
+    en el asunto y, si no hay, el dominio del remitente (lógica OR).
+    """
+
+    def __init__(self, keyword_index, domain_set, domain_case):
+        self.keyword_index = keyword_index
+        self.domain_set = domain_set
+        self.domain_case = domain_case
+
+    def match(self, subject, sender):
+        """
+        Returns:
+            Tupla (nombre_caso, motivo) donde motivo es 'PALABRA CLAVE' o 'DOMINIO',
+            o (None, None) si no coincide ningún caso
+        """
+        subject_lower = (subject or '').lower()
+        for keyword, case_name in self.keyword_index:
+            if keyword in subject_lower:
+                return case_name, 'PALABRA CLAVE'
+
+        # El dominio no depende del caso: coincide el primer caso cargado
+        if self.domain_set and self.domain_case and _sender_domain(sender) in self.domain_set:
+            return self.domain_case, 'DOMINIO'
+
+        return None, None
+
 
 class CaseHandler:
     def __init__(self):
@@ -65,6 +124,42 @@ class CaseHandler:
             }
         return None
 
+    def get_keyword_index(self):
+        """
+        Construye la lista de palabras clave de todos los casos, ya en minúsculas
+
+        Se calcula una vez por ciclo de revisión y se reutiliza para todos los correos,
+        en lugar de releer la configuración de cada caso por cada correo.
+
+        Returns:
+            Lista de tuplas (palabra_clave_minúsculas, nombre_caso) en el mismo
+            orden en que se cargaron los casos
+        """
+        keyword_index = []
+
+        for case_name, case_obj in self.cases.items():
+            try:
+                for keyword in case_obj.get_search_keywords():
+                    if keyword:
+                        keyword_index.append((keyword.lower(), case_name))
+            except Exception as e:
+                _log.error("❌ Error al obtener keywords de %s: %s", case_name, e)
+
+        return keyword_index
+
+    def prepare_matcher(self, allowed_domains=None):
+        """
+        Prepara un CaseMatcher para revisar un lote de correos
+
+        Args:
+            allowed_domains: String con dominios permitidos separados por comas o None
+
+        Returns:
+            CaseMatcher con las palabras clave y los dominios ya normalizados
+        """
+        domain_case = next(iter(self.cases), None)
+        return CaseMatcher(self.get_keyword_index(), _parse_allowed_domains(allowed_domains), domain_case)
+
     def execute_case(self, case_name, email_data, logger):
         """Ejecuta un caso específico"""
         if case_name in self.cases:
@@ -82,6 +177,9 @@ class CaseHandler:
         """
         Busca el primer caso que coincida con el asunto O dominio del email (lógica OR)
 
+        Para un solo correo; al revisar un lote conviene preparar el CaseMatcher una vez
+        con prepare_matcher() y llamar a match() por cada correo.
+
         Args:
             subject: Asunto del correo
             sender: Remitente del correo (puede incluir nombre y email)
@@ -91,67 +189,10 @@ class CaseHandler:
         Returns:
             Nombre del caso si coincide, None si no
         """
-        print(f"[DEBUG CaseHandler] Buscando caso para asunto: '{subject}'")
-        print(f"[DEBUG CaseHandler] Sender: '{sender}'")
-        print(f"[DEBUG CaseHandler] Dominios permitidos: '{allowed_domains}'")
-        print(f"[DEBUG CaseHandler] Casos disponibles: {list(self.cases.keys())}")
-
-        # Extraer dominio del sender
-        sender_domain = None
-        if sender and '@' in sender:
-            # El sender puede venir como "Nombre <email@domain.com>" o "email@domain.com"
-            import re
-            email_match = re.search(r'[\w\.-]+@[\w\.-]+', sender)
-            if email_match:
-                email_address = email_match.group(0)
-                sender_domain = '@' + email_address.split('@')[1]
-                print(f"[DEBUG CaseHandler] Dominio extraído del sender: '{sender_domain}'")
-
-        # Parsear dominios permitidos
-        domains_list = []
-        if allowed_domains and allowed_domains.strip():
-            # Separar por comas y limpiar espacios
-            domains_list = [d.strip() for d in allowed_domains.split(',') if d.strip()]
-            print(f"[DEBUG CaseHandler] Dominios parseados: {domains_list}")
-
-        for case_name, case_obj in self.cases.items():
-            try:
-                print(f"[DEBUG CaseHandler] Verificando caso: {case_name}")
-                keywords = case_obj.get_search_keywords()
-                print(f"[DEBUG CaseHandler] Keywords para {case_name}: {keywords}")
-
-                # VERIFICACIÓN 1: Buscar por palabra clave en el asunto
-                keyword_match = False
-                for keyword in keywords:
-                    print(f"[DEBUG CaseHandler] ¿'{keyword.lower()}' en '{subject.lower()}'?")
-                    if keyword.lower() in subject.lower():
-                        keyword_match = True
-                        logger.info(f"✓ Caso encontrado por PALABRA CLAVE: {case_name} ('{keyword}')")
-                        print(f"[DEBUG CaseHandler] ✓ MATCH por palabra clave!")
-                        return case_name
-
-                # VERIFICACIÓN 2: Buscar por dominio del remitente (si hay dominios configurados)
-                domain_match = False
-                if sender_domain and domains_list:
-                    for allowed_domain in domains_list:
-                        # Normalizar para comparación (case insensitive)
-                        if sender_domain.lower() == allowed_domain.lower():
-                            domain_match = True
-                            logger.info(f"✓ Caso encontrado por DOMINIO: {case_name} ('{sender_domain}')")
-                            print(f"[DEBUG CaseHandler] ✓ MATCH por dominio!")
-                            return case_name
-
-                # Si no hubo match ni por keyword ni por dominio
-                if not keyword_match and not domain_match:
-                    print(f"[DEBUG CaseHandler] ✗ No coincide (ni keyword ni dominio)")
-
-            except Exception as e:
-                logger.exception(f"Error al verificar caso {case_name}: {str(e)}")
-                print(f"[DEBUG CaseHandler] ❌ Error en caso {case_name}: {e}")
-                continue
-
-        print(f"[DEBUG CaseHandler] ❌ No se encontró ningún caso que coincida")
-        return None
+        case_name, motivo = self.prepare_matcher(allowed_domains).match(subject, sender)
+        if case_name:
+            logger.info(f"✓ Caso encontrado por {motivo}: {case_name}")
+        return case_name
 
     def reload_cases(self):
         """Recarga todos los casos disponibles"""
@@ -99,7 +99,8 @@ class ConfigManager:
         return {
             'provider': config.get('provider', ''),
             'email': config.get('email', ''),
-            'password': config.get('password', '')
+            'password': config.get('password', ''),
+            'smtp_local_relay': config.get('smtp_local_relay', False)
         }
 
     def set_email_config(self, provider, email, password):
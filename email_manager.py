@@ -2,101 +2,353 @@
 # Ubicación: raíz del proyecto
 # Descripción: Gestiona las operaciones de correo electrónico (SMTP e IMAP)
 
-import email
+import base64
+import copy
+import hashlib
 import imaplib
+import io
+import ipaddress
+import logging
 import os
+import random
+import re
+import select
 import smtplib
 import ssl
 import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime, timedelta
-from email import encoders
+from functools import lru_cache
+from itertools import count, islice
+from email import policy
+from email.feedparser import BytesFeedParser
+from email.generator import BytesGenerator
 from email.header import decode_header
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from email.message import EmailMessage, MIMEPart
+from email.parser import BytesHeaderParser
+
+try:
+    # Opcional: autómata Aho-Corasick para buscar todas las palabras clave en una pasada
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 from case_handler import CaseHandler
 from case1 import _traducir_mensaje_garantia_usuario
 
+# Política moderna de parseo: los encabezados ya se entregan decodificados como str
+_EMAIL_POLICY = policy.default
+
+# Parser solo de encabezados para la descarga previa de Asunto/Remitente
+_HEADER_PARSER = BytesHeaderParser(policy=_EMAIL_POLICY)
+
+# Logger por defecto para los helpers cuando el llamador no proporciona uno
+_log = logging.getLogger(__name__)
+
+
+# Máximo de IDs por comando STORE, para no enviar líneas de comando enormes al servidor
+_STORE_BATCH_SIZE = 100
+
+
+def _mark_batch_as_read(imap_connection, msg_ids, logger):
+    """
+    Marca varios emails como leídos con un UID STORE por cada _STORE_BATCH_SIZE UIDs
+
+    IMAP acepta conjuntos de IDs separados por comas ("1,3,7"), así que cada bloque
+    se marca en un solo viaje de ida y vuelta al servidor en lugar de uno por correo.
+    Si un bloque falla se siguen marcando los demás.
+    """
+    if not msg_ids:
+        return True, "No hay emails por marcar"
+
+    ok = True
+    mensaje = "Email marcado como leído"
+    for start in range(0, len(msg_ids), _STORE_BATCH_SIZE):
+        id_set = ','.join(msg_ids[start:start + _STORE_BATCH_SIZE])
+        try:
+            status, result = imap_connection.uid('STORE', id_set, '+FLAGS', '\\Seen')
+
+            if status == 'OK':
+                logger.info("Email(s) %s marcado(s) como leído(s)", id_set)
+            else:
+                ok, mensaje = False, f"Estado no OK del servidor: {status}"
+
+        except Exception as e:
+            logger.exception("Excepción al marcar email como leído: %s", e)
+            ok, mensaje = False, f"Error: {str(e)}"
+
+    return ok, mensaje
+
+
+_FETCH_UID_RE = re.compile(rb'\bUID (\d+)')
+
+
+def _iter_fetch_payloads(fetch_data):
+    """
+    Recorre la respuesta de un UID FETCH por lotes y produce (uid, contenido)
+
+    imaplib entrega cada mensaje como una tupla (b'<seq> (UID <uid> <item> {n}', contenido)
+    seguida de un b')' de cierre. Algunos servidores envían el UID después del
+    contenido (b' UID <uid>)'), por eso también se busca en el elemento de cierre.
+    """
+    pendiente = None
+    for item in fetch_data:
+        if isinstance(item, tuple) and len(item) == 2:
+            match = _FETCH_UID_RE.search(item[0])
+            if match:
+                yield match.group(1).decode('ascii'), item[1]
+                pendiente = None
+            else:
+                pendiente = item[1]
+        elif pendiente is not None and isinstance(item, bytes):
+            match = _FETCH_UID_RE.search(item)
+            if match:
+                yield match.group(1).decode('ascii'), pendiente
+            pendiente = None
+
+
+# Meses en inglés para fechas IMAP (RFC 3501): %b de strftime depende del locale
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+@lru_cache(maxsize=1)
+def _imap_since_date(today):
+    """Fecha de ayer en formato IMAP (dd-Mon-yyyy); se recalcula solo al cambiar el día"""
+    yesterday = today - timedelta(days=1)
+    return f"{yesterday.day:02d}-{_MONTHS[yesterday.month - 1]}-{yesterday.year}"
+
 
-def _mark_as_read(imap_connection, msg_id, logger):
-    """Marca un email específico como leído"""
+def _imap_or(queries):
+    """
+    Combina criterios de búsqueda IMAP con OR anidados
+
+    OR recibe exactamente dos argumentos (RFC 3501), así que con más de dos criterios
+    se arma (OR a (OR b c)) en lugar de (OR a b c), que los servidores rechazan.
+    """
+    if len(queries) == 1:
+        return queries[0]
+    return f'(OR {queries[0]} {_imap_or(queries[1:])})'
+
+
+# Etiquetas propias para IDLE: el comando no pasa por imaplib, que solo conoce sus etiquetas
+_IDLE_TAGS = count(1)
+
+
+def _imap_has_buffered_line(imap):
+    """
+    Indica si ya hay datos para leer de la sesión sin bloquear
+
+    imaplib lee por un archivo con buffer (imap.file): una respuesta que llegó en el mismo
+    paquete que la anterior ya está en ese buffer y select() sobre el socket no la ve.
+    Se mira el buffer con el socket en modo no bloqueante (también recoge los bytes ya
+    descifrados de TLS) y se restaura el timeout original.
+    """
+    sock = imap.sock
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
     try:
-        status, result = imap_connection.store(msg_id, '+FLAGS', '\\Seen')
+        return bool(imap.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
 
-        if status == 'OK':
-            logger.info(f"Email {msg_id} marcado como leído")
-            return True, "Email marcado como leído"
-        else:
-            return False, f"Estado no OK del servidor: {status}"
 
-    except Exception as e:
-        logger.exception(f"Excepción al marcar email como leído: {str(e)}")
-        return False, f"Error: {str(e)}"
+def _imap_idle(imap, timeout):
+    """
+    Envía IDLE sobre una sesión con INBOX seleccionada y espera hasta timeout segundos
 
+    Termina con DONE al primer EXISTS o al vencer el plazo, y consume las respuestas
+    hasta la etiqueta del comando. Retorna True si alguna respuesta fue EXISTS.
+    """
+    tag = b'IDLE%d' % next(_IDLE_TAGS)
+    imap.send(tag + b' IDLE\r\n')
+    line = imap.readline()
+    if not line.startswith(b'+'):
+        raise imap.error(f"IDLE rechazado: {line.strip()!r}")
+
+    new_mail = False
+    deadline = time.monotonic() + timeout
+    while not new_mail:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not _imap_has_buffered_line(imap):
+            readable, _, _ = select.select([imap.sock], [], [], remaining)
+            if not readable:
+                break
+        line = imap.readline()
+        if not line:
+            raise imap.abort("Conexión cerrada durante IDLE")
+        new_mail = line.rstrip().endswith(b'EXISTS')
+
+    imap.send(b'DONE\r\n')
+    while True:
+        line = imap.readline()
+        if not line:
+            raise imap.abort("Conexión cerrada durante IDLE")
+        if line.startswith(tag + b' '):
+            return new_mail
+        new_mail = new_mail or line.rstrip().endswith(b'EXISTS')
+
+
+def _is_loopback_host(host):
+    """Indica si el servidor SMTP es la propia máquina (MTA local en loopback)"""
+    if host == 'localhost':
+        return True
 
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+# Tabla para str.translate que elimina los caracteres ASCII no imprimibles
+_ASCII_NO_IMPRIMIBLES = {i: None for i in range(128) if not chr(i).isprintable()}
+
+
+class _SanitizeTable(dict):
+    """
+    Tabla de str.translate para texto no ASCII que se completa a medida que aparecen
+    caracteres: elimina los no imprimibles y el espacio duro (U+00A0)
+
+    Una tabla completa de Unicode tendría cientos de miles de entradas; así solo se
+    guardan los caracteres que realmente se han visto.
+    """
+
+    def __missing__(self, code):
+        value = None if code == 0xA0 or not chr(code).isprintable() else code
+        self[code] = value
+        return value
+
+
+_SANITIZE_TABLE = _SanitizeTable(_ASCII_NO_IMPRIMIBLES)
+
+
+@lru_cache(maxsize=8)
 def _sanitize_string(text):
-    """Sanitiza un string para evitar problemas de codificación"""
+    """
+    Sanitiza un string para evitar problemas de codificación
+
+    Se cachea porque las mismas credenciales se sanitizan en cada conexión
+    (pruebas, envío y cada ciclo de monitoreo). La caché es pequeña a propósito:
+    guarda contraseñas, así que solo retiene las de las cuentas en uso.
+    """
     if not isinstance(text, str):
         return str(text)
 
-    text = ''.join(c for c in text if c.isprintable() and ord(c) != 0xA0)
-    return text
+    # Caso común (credenciales ASCII): str.translate elimina los de control en C
+    if text.isascii():
+        # Sin caracteres de control no hace falta construir una cadena nueva
+        if text.isprintable():
+            return text
+        return text.translate(_ASCII_NO_IMPRIMIBLES)
+
+    return text.translate(_SANITIZE_TABLE)
+
+
+@lru_cache(maxsize=2048)
+def _decode_header_cached(header_value):
+    """Decodificación RFC 2047 de una cabecera; los valores repetidos salen de la caché"""
+    parts_out = []
+
+    for part, encoding in decode_header(header_value):
+        if not isinstance(part, bytes):
+            parts_out.append(part)
+        elif encoding:
+            parts_out.append(part.decode(encoding))
+        else:
+            parts_out.append(part.decode('utf-8', errors='ignore'))
+
+    return ''.join(parts_out)
 
 
-def _decode_header_value(header_value):
+def _decode_header_value(header_value, logger=None):
     """Decodifica un valor de cabecera que puede estar codificado"""
     if not header_value:
         return ""
 
-    try:
-        decoded_parts = decode_header(header_value)
-        decoded_text = ""
+    if isinstance(header_value, bytes):
+        # str() de bytes daría "b'...'": se decodifica como el resto de partes sin charset
+        header_value = header_value.decode('utf-8', errors='ignore')
+    else:
+        header_value = str(header_value)
 
-        for part, encoding in decoded_parts:
-            if isinstance(part, bytes):
-                if encoding:
-                    decoded_text += part.decode(encoding)
-                else:
-                    decoded_text += part.decode('utf-8', errors='ignore')
-            else:
-                decoded_text += part
+    # Sin palabras codificadas RFC 2047 ("=?charset?...?=") no hay nada que decodificar
+    if '=?' not in header_value:
+        return header_value
 
-        return decoded_text
+    try:
+        return _decode_header_cached(header_value)
     except Exception as e:
-        print(f"Error al decodificar cabecera: {str(e)}")
+        (logger or _log).error("Error al decodificar cabecera: %s", e, exc_info=True)
         return str(header_value)
 
 
-def _extract_body_text(email_message):
-    """Extrae el texto del cuerpo del correo"""
-    body_text = ""
-
-    try:
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                content_type = part.get_content_type()
-                content_disposition = str(part.get("Content-Disposition", ""))
+def _decode_part_text(part):
+    """
+    Decodifica el contenido de una parte de texto con el charset que declara
 
-                # Solo extraer texto plano, no adjuntos
-                if content_type == "text/plain" and "attachment" not in content_disposition:
-                    try:
-                        body_text += part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    except:
-                        pass
-        else:
-            # Correo simple, no multipart
-            try:
-                body_text = email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
-            except:
-                body_text = str(email_message.get_payload())
-    except Exception as e:
-        print(f"Error al extraer cuerpo del correo: {str(e)}")
+    Si la parte no declara charset se asume UTF-8; si declara uno que Python no
+    conoce también se cae a UTF-8. Los bytes inválidos se reemplazan en lugar de
+    lanzar excepción.
 
-    return body_text
+    Las partes text/* con charset declarado, parseadas con la política moderna, se
+    resuelven con get_content() del contentmanager, que ya devuelve el str.
+    """
+    charset = part.get_content_charset()
+    if charset and part.get_content_maintype() == 'text' and isinstance(part, MIMEPart):
+        try:
+            return part.get_content()
+        except LookupError:
+            # Charset que Python no conoce: se decodifica abajo como UTF-8
+            pass
 
+    raw = part.get_payload(decode=True)
+    if not raw:
+        return ""
 
-def _detectar_garantia_en_correo(body_text, logger):
+    charset = charset or 'utf-8'
+    try:
+        return raw.decode(charset, errors='replace')
+    except LookupError:
+        return raw.decode('utf-8', errors='replace')
+
+
+# Patrones de garantía en orden de prioridad: primero frases completas, luego palabras
+# individuales. Formato: (patrón_regex, nombre_garantía_normalizado)
+_GARANTIA_PATRONES = (
+    # Frases completas primero (más específicas)
+    (r'SIN\s+GARANT[IÍ]A', 'No'),  # "sin garantia" o "sin garantía"
+    (r'C\.?\s*S\.?\s*R\.?', 'C.S.R'),  # "CSR", "C.S.R", "C.S.R.", "C S R"
+
+    # Palabras individuales
+    (r'NORMAL', 'Normal'),
+    (r'DOA', 'DOA'),
+    (r'STOCK', 'Stock'),
+    (r'DAP', 'DAP'),
+    (r'SIN', 'No'),  # "sin" solo
+    (r'NO', 'No'),  # "no" solo (al final para evitar falsos positivos)
+)
+
+# Todos los patrones en una sola alternación compilada al importar el módulo;
+# cada patrón es un grupo y su número (lastindex) da la prioridad
+_GARANTIA_RE = re.compile(
+    r'\b(?:' + '|'.join(f'({patron})' for patron, _ in _GARANTIA_PATRONES) + r')\b')
+
+
+# Subcadenas que toda coincidencia de _GARANTIA_RE contiene ("NORMAL" incluye "NO" y
+# "SIN GARANTÍA" incluye "SIN"). Para C.S.R, tras la "C" viene "S", un punto o un espacio;
+# el espacio es cualquier \s (también NBSP y espacios Unicode), por eso va con regex.
+# Si nada de esto aparece en el cuerpo no hace falta ejecutar la expresión regular.
+_GARANTIA_TOKENS = ("NO", "SIN", "DOA", "STOCK", "DAP", "CS", "C.")
+_GARANTIA_C_ESPACIO_RE = re.compile(r'C\s')
+
+
+def _detectar_garantia_en_correo(body_upper, logger):
     """
     Detecta si en el cuerpo del correo viene alguna palabra clave de garantía.
 
@@ -112,51 +364,220 @@ def _detectar_garantia_en_correo(body_text, logger):
     - "stock" → Stock
     - "dap" → DAP
 
+    body_upper es el cuerpo ya convertido a mayúsculas (ver _analyze_body).
+
     Retorna:
         dict con {'encontrada': bool, 'garantia': str o None}
     """
-    if not body_text:
+    if not body_upper or not (any(token in body_upper for token in _GARANTIA_TOKENS)
+                              or _GARANTIA_C_ESPACIO_RE.search(body_upper)):
         return {'encontrada': False, 'garantia': None}
 
     try:
-        import re
-
-        # Normalizar el texto a mayúsculas para búsqueda case-insensitive
-        body_upper = body_text.upper()
-
-        # Definir patrones de búsqueda en orden de prioridad
-        # Primero frases completas, luego palabras individuales
-        # Formato: (patrón_regex, nombre_garantía_normalizado)
-        patrones_garantia = [
-            # Frases completas primero (más específicas)
-            (r'\bSIN\s+GARANT[IÍ]A\b', 'No'),  # "sin garantia" o "sin garantía"
-            (r'\bC\.?\s*S\.?\s*R\.?\b', 'C.S.R'),  # "CSR", "C.S.R", "C.S.R.", "C S R"
-
-            # Palabras individuales
-            (r'\bNORMAL\b', 'Normal'),
-            (r'\bDOA\b', 'DOA'),
-            (r'\bSTOCK\b', 'Stock'),
-            (r'\bDAP\b', 'DAP'),
-            (r'\bSIN\b', 'No'),  # "sin" solo
-            (r'\bNO\b', 'No'),   # "no" solo (al final para evitar falsos positivos)
-        ]
-
-        # Buscar cada patrón en orden de prioridad
-        for patron, garantia_nombre in patrones_garantia:
-            if re.search(patron, body_upper):
-                logger.info(f"✓ Palabra clave de garantía detectada en correo: '{garantia_nombre}'")
-                logger.info(f"  Patrón encontrado: {patron}")
-                return {'encontrada': True, 'garantia': garantia_nombre}
+        # Una sola pasada sobre el cuerpo: el grupo que coincide indica la prioridad
+        mejor = None
+        for match in _GARANTIA_RE.finditer(body_upper):
+            prioridad = match.lastindex - 1
+            if mejor is None or prioridad < mejor:
+                mejor = prioridad
+                if prioridad == 0:
+                    break
+
+        if mejor is not None:
+            patron, garantia_nombre = _GARANTIA_PATRONES[mejor]
+            logger.info("✓ Palabra clave de garantía detectada en correo: '%s'", garantia_nombre)
+            logger.info("  Patrón encontrado: %s", patron)
+            return {'encontrada': True, 'garantia': garantia_nombre}
 
         # No se encontró ninguna palabra clave de garantía
         return {'encontrada': False, 'garantia': None}
 
     except Exception as e:
-        logger.error(f"Error al detectar garantía en correo: {str(e)}")
+        logger.error("Error al detectar garantía en correo: %s", e)
         return {'encontrada': False, 'garantia': None}
 
 
-def _detectar_proveedor_en_correo(body_text, logger):
+def _is_word_char(char):
+    """Indica si el carácter cuenta como parte de una palabra (igual que \\w en regex)"""
+    return char.isalnum() or char == '_'
+
+
+def _word_hit(hay, needle):
+    """
+    Indica si needle aparece en hay como palabra completa
+
+    Equivale a re.search(r'\\b' + re.escape(needle) + r'\\b', hay) para literales,
+    pero usa str.find (búsqueda en C) y solo revisa los caracteres vecinos de cada aparición.
+    """
+    if not needle:
+        return False
+
+    end_offset = len(needle)
+    i = hay.find(needle)
+    while i != -1:
+        end = i + end_offset
+        if (i == 0 or not _is_word_char(hay[i - 1])) and (end == len(hay) or not _is_word_char(hay[end])):
+            return True
+        i = hay.find(needle, i + 1)
+    return False
+
+
+def _regex_finder(keywords):
+    """Buscador de respaldo: una sola alternación compilada con límites de palabra"""
+    # Las más largas van primero para que "CTC GROUP" gane a "CTC"
+    alternativas = sorted(keywords, key=len, reverse=True)
+    regex = re.compile(r'\b(' + '|'.join(re.escape(k) for k in alternativas) + r')\b')
+
+    def find(hay):
+        match = regex.search(hay)
+        return match.group(1) if match else None
+
+    return find
+
+
+def _ahocorasick_finder(keywords):
+    """
+    Buscador con autómata Aho-Corasick (pyahocorasick)
+
+    Recorre el texto una sola vez sin importar cuántas palabras haya y devuelve lo
+    mismo que _regex_finder: la coincidencia con límites de palabra que empieza
+    primero y, entre las que empiezan en la misma posición, la más larga.
+    """
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    max_len = max(map(len, keywords))
+
+    def find(hay):
+        best = None
+        best_start = -1
+        for end, keyword in automaton.iter(hay):
+            start = end - len(keyword) + 1
+            # Las coincidencias llegan ordenadas por posición final: ninguna posterior
+            # puede empezar antes que la mejor encontrada
+            if best is not None and end - max_len + 1 > best_start:
+                break
+            if best is not None and (start > best_start or (start == best_start and len(keyword) <= len(best))):
+                continue
+            # Mismo criterio que \b: cambia el tipo de carácter (palabra / no palabra)
+            before = start > 0 and _is_word_char(hay[start - 1])
+            after = end + 1 < len(hay) and _is_word_char(hay[end + 1])
+            if before != _is_word_char(keyword[0]) and after != _is_word_char(keyword[-1]):
+                best, best_start = keyword, start
+        return best
+
+    return find
+
+
+def _keyword_matcher(entries):
+    """
+    Prepara la búsqueda de varias palabras clave en un solo recorrido del texto
+
+    Args:
+        entries: tupla de (palabra_clave, valor) en orden de configuración
+
+    Retorna:
+        (find, dict palabra_normalizada → valor); find(texto) devuelve la palabra
+        normalizada encontrada o None, y es None si no hay palabras. Las palabras se
+        normalizan a mayúsculas y sin espacios extremos para buscarlas sobre el cuerpo
+        ya convertido a mayúsculas. Si una palabra se repite gana la primera entrada.
+        Con pyahocorasick instalado se usa su autómata; si no, una alternación regex.
+    """
+    lookup = {}
+    for keyword, value in entries:
+        normalizada = keyword.upper().strip()
+        if normalizada:
+            lookup.setdefault(normalizada, value)
+
+    if not lookup:
+        return None, lookup
+
+    if ahocorasick is not None:
+        return _ahocorasick_finder(tuple(lookup)), lookup
+    return _regex_finder(tuple(lookup)), lookup
+
+
+def _with_proveedor_matchers(config_data):
+    """
+    Agrega a la configuración de proveedores lo que la detección necesita ya preparado
+
+    - '_campo_keywords': tuplas (palabra_original, palabra_normalizada) del campo "proveedor"
+    - '_proveedor_matcher': (find, lookup) de _keyword_matcher con todas las palabras
+      clave de los proveedores que tienen id; lookup → (nombre, id, palabra_clave)
+
+    Así la construcción de patrones ocurre una vez por versión del archivo y no por correo.
+    """
+    proveedores = config_data.get('proveedores', {})
+    palabras_clave_campo = config_data.get('palabras_clave_campo', ['PROVEEDOR'])
+
+    return {
+        **config_data,
+        '_campo_keywords': tuple((palabra, palabra.upper().strip()) for palabra in palabras_clave_campo),
+        '_proveedor_matcher': _keyword_matcher(tuple(
+            (palabra_clave, (nombre_proveedor, datos_proveedor.get('id'), palabra_clave))
+            for nombre_proveedor, datos_proveedor in proveedores.items()
+            if datos_proveedor.get('id')
+            for palabra_clave in datos_proveedor.get('palabras_clave', [])
+        )),
+    }
+
+
+@lru_cache(maxsize=1)
+def _cached_proveedores_config(mtime):
+    """Carga config_proveedores.json una vez por versión (mtime) del archivo"""
+    from config_manager import get_proveedores_config
+    return _with_proveedor_matchers(get_proveedores_config())
+
+
+def _with_mapeo_dict(config_data):
+    """
+    Agrega a la configuración de servitotal el índice '_mapeo_dict'
+
+    Permite resolver codigo_buscar → codigo_enviar con una búsqueda en diccionario en
+    lugar de recorrer la lista de mapeos; si un código se repite gana el primero.
+    """
+    mapeo_dict = {}
+    for mapeo in config_data.get('mapeos', []):
+        mapeo_dict.setdefault(mapeo.get('codigo_buscar', ''), mapeo.get('codigo_enviar', ''))
+    return {**config_data, '_mapeo_dict': mapeo_dict}
+
+
+@lru_cache(maxsize=1)
+def _cached_servitotal_config(mtime):
+    """Carga config_servitotal.json una vez por versión (mtime) del archivo"""
+    from config_manager import get_servitotal_config
+    return _with_mapeo_dict(get_servitotal_config())
+
+
+def _load_proveedores_config():
+    """
+    Devuelve la configuración de proveedores sin releer el JSON en cada correo
+
+    La caché se invalida sola cuando cambia la fecha de modificación del archivo
+    (por ejemplo al guardar desde la GUI). El diccionario devuelto es compartido:
+    no debe modificarse.
+    """
+    from config_manager import get_proveedores_config, get_proveedores_config_path
+    try:
+        mtime = os.path.getmtime(get_proveedores_config_path())
+    except OSError:
+        # El archivo aún no existe: el loader lo crea con valores por defecto
+        return _with_proveedor_matchers(get_proveedores_config())
+    return _cached_proveedores_config(mtime)
+
+
+def _load_servitotal_config():
+    """Igual que _load_proveedores_config, para los mapeos de servitotal"""
+    from config_manager import get_servitotal_config, get_servitotal_config_path
+    try:
+        mtime = os.path.getmtime(get_servitotal_config_path())
+    except OSError:
+        return _with_mapeo_dict(get_servitotal_config())
+    return _cached_servitotal_config(mtime)
+
+
+def _detectar_proveedor_en_correo(body_upper, logger):
     """
     Detecta si en el cuerpo del correo viene el campo 'Proveedor' (que representa distribuidor)
     y busca un match con los distribuidores disponibles usando palabras clave configurables.
@@ -167,81 +588,67 @@ def _detectar_proveedor_en_correo(body_text, logger):
     2. 'proveedores': lista de proveedores con sus palabras clave de búsqueda,
        permitiendo agregar variantes sin modificar el código.
 
+    body_upper es el cuerpo ya convertido a mayúsculas (ver _analyze_body).
+
     Retorna:
         dict con {'encontrado': bool, 'distribuidor_id': str o None, 'distribuidor_nombre': str o None}
     """
-    if not body_text:
+    if not body_upper:
         return {'encontrado': False, 'distribuidor_id': None, 'distribuidor_nombre': None}
 
     try:
-        import re
-        from config_manager import get_proveedores_config
-
-        # Cargar configuración de proveedores desde archivo JSON
-        config_data = get_proveedores_config()
+        # Cargar configuración de proveedores (cacheada hasta que cambie el archivo)
+        config_data = _load_proveedores_config()
         proveedores = config_data.get('proveedores', {})
-        palabras_clave_campo = config_data.get('palabras_clave_campo', ['PROVEEDOR'])
 
         if not proveedores:
             logger.warning("⚠ No se pudieron cargar los proveedores desde config_proveedores.json")
             return {'encontrado': False, 'distribuidor_id': None, 'distribuidor_nombre': None}
 
-        # Normalizar el texto a mayúsculas para búsqueda
-        body_upper = body_text.upper()
-
-        # Buscar cualquiera de las palabras clave del campo "proveedor" en el texto
-        palabra_encontrada = None
-        for palabra in palabras_clave_campo:
-            palabra_upper = palabra.upper().strip()
-            pattern = r'\b' + re.escape(palabra_upper) + r'\b'
-            if re.search(pattern, body_upper):
-                palabra_encontrada = palabra
-                break
+        # Buscar cualquiera de las palabras clave del campo "proveedor" en el texto;
+        # son pocos literales cortos, str.find es más rápido que el motor de regex
+        palabra_encontrada = next((palabra for palabra, normalizada in config_data['_campo_keywords']
+                                   if _word_hit(body_upper, normalizada)), None)
 
         if palabra_encontrada:
-            logger.info(f"✓ Campo de proveedor detectado usando palabra clave: '{palabra_encontrada}'")
-
-            # Buscar match con algún proveedor usando sus palabras clave configuradas
-            for nombre_proveedor, datos_proveedor in proveedores.items():
-                distribuidor_id = datos_proveedor.get('id')
-                palabras_clave = datos_proveedor.get('palabras_clave', [])
-
-                if not distribuidor_id or not palabras_clave:
-                    continue
-
-                # Buscar cada palabra clave en el cuerpo del correo
-                for palabra_clave in palabras_clave:
-                    # Las palabras ya están en mayúsculas en el config
-                    palabra_normalizada = palabra_clave.upper().strip()
-
-                    # Buscar la palabra clave en el cuerpo del correo
-                    # Usar \b para límites de palabra para matching exacto
-                    pattern = r'\b' + re.escape(palabra_normalizada) + r'\b'
-
-                    if re.search(pattern, body_upper):
-                        logger.info(
-                            f"✓ Proveedor (distribuidor) detectado en correo: '{nombre_proveedor}' "
-                            f"(ID: {distribuidor_id}) usando palabra clave: '{palabra_clave}'")
-                        return {
-                            'encontrado': True,
-                            'distribuidor_id': distribuidor_id,
-                            'distribuidor_nombre': nombre_proveedor
-                        }
-
-            logger.info(f"⚠ Se encontró campo de proveedor ('{palabra_encontrada}') pero no coincide con ningún distribuidor conocido")
+            logger.info("✓ Campo de proveedor detectado usando palabra clave: '%s'", palabra_encontrada)
+
+            # Todas las palabras clave de todos los proveedores en un solo buscador (preparado una vez)
+            proveedor_find, proveedor_lookup = config_data['_proveedor_matcher']
+            encontrada = proveedor_find(body_upper) if proveedor_find else None
+
+            if encontrada:
+                nombre_proveedor, distribuidor_id, palabra_clave = proveedor_lookup[encontrada]
+                logger.info("✓ Proveedor (distribuidor) detectado en correo: '%s' (ID: %s) usando palabra clave: '%s'",
+                            nombre_proveedor, distribuidor_id, palabra_clave)
+                return {
+                    'encontrado': True,
+                    'distribuidor_id': distribuidor_id,
+                    'distribuidor_nombre': nombre_proveedor
+                }
+
+            logger.info("⚠ Se encontró campo de proveedor ('%s') pero no coincide con ningún distribuidor conocido",
+                        palabra_encontrada)
             return {'encontrado': False, 'distribuidor_id': None, 'distribuidor_nombre': None}
         else:
             logger.info("ℹ No se encontró ninguna palabra clave del campo proveedor en el correo")
             return {'encontrado': False, 'distribuidor_id': None, 'distribuidor_nombre': None}
 
     except Exception as e:
-        logger.error(f"Error al detectar proveedor en correo: {str(e)}")
+        logger.error("Error al detectar proveedor en correo: %s", e)
         import traceback
         traceback.print_exc()
         return {'encontrado': False, 'distribuidor_id': None, 'distribuidor_nombre': None}
 
 
-def _detectar_servitotal_en_correo(body_text, logger):
+# Patrón para buscar "servitotal" seguido de código de sucursal
+# Formato: servitotal[:] [espacio] (1-4 dígitos) [opcionalmente nombre]
+# Captura solo los dígitos; el nombre que sigue no se consume (se descartaba de todas
+# formas y el sufijo [\w\s\-]+ provocaba backtracking innecesario en cuerpos largos)
+_SERVITOTAL_RE = re.compile(r'\bSERVITOTAL\s*:?\s*(\d{1,4})')
+
+
+def _detectar_servitotal_en_correo(body_upper, logger):
     """
     Detecta si en el cuerpo del correo viene la palabra clave 'servitotal'
     seguida de un código de sucursal (1-4 dígitos, opcionalmente seguido de nombre).
@@ -258,55 +665,36 @@ def _detectar_servitotal_en_correo(body_text, logger):
     - SERVITOTAL 123
 
     Args:
-        body_text: Texto del cuerpo del correo
+        body_upper: Texto del cuerpo del correo ya convertido a mayúsculas
         logger: Logger para registrar eventos
 
     Retorna:
         dict con {'encontrado': bool, 'codigo_sucursal': str o None}
     """
-    if not body_text:
+    # Toda coincidencia contiene el literal: sin él no hace falta ejecutar la regex
+    if not body_upper or 'SERVITOTAL' not in body_upper:
         return {'encontrado': False, 'codigo_sucursal': None}
 
     try:
-        import re
-        from config_manager import get_servitotal_config
-
-        # Normalizar el texto a mayúsculas para búsqueda case-insensitive
-        body_upper = body_text.upper()
-
-        # Patrón para buscar "servitotal" seguido de código de sucursal
-        # Formato: servitotal[:] [espacio] (1-4 dígitos) [opcionalmente nombre]
-        # Captura solo los dígitos, ignorando el nombre si existe
-        pattern = r'\bSERVITOTAL\s*:?\s*(\d{1,4})(?:\s+[\w\s\-]+)?'
-
-        match = re.search(pattern, body_upper)
+        match = _SERVITOTAL_RE.search(body_upper)
 
         if match:
             codigo_original = match.group(1)
-            logger.info(f"✓ Palabra clave 'servitotal' detectada en correo con código original: '{codigo_original}'")
+            logger.info("✓ Palabra clave 'servitotal' detectada en correo con código original: '%s'", codigo_original)
 
-            # Cargar configuración de mapeos
-            config_data = get_servitotal_config()
-            mapeos = config_data.get('mapeos', [])
+            # Cargar configuración de mapeos (diccionario codigo_buscar → codigo_enviar)
+            mapeo_dict = _load_servitotal_config()['_mapeo_dict']
 
             # Buscar si existe un mapeo para este código
-            codigo_final = codigo_original
-            mapeo_encontrado = False
-
-            for mapeo in mapeos:
-                codigo_buscar = mapeo.get('codigo_buscar', '')
-                codigo_enviar = mapeo.get('codigo_enviar', '')
+            mapeo_encontrado = codigo_original in mapeo_dict
+            codigo_final = mapeo_dict.get(codigo_original, codigo_original)
 
-                if codigo_buscar == codigo_original:
-                    codigo_final = codigo_enviar
-                    mapeo_encontrado = True
-                    logger.info(f"  ✓ Mapeo encontrado: '{codigo_original}' → '{codigo_final}'")
-                    break
-
-            if not mapeo_encontrado:
-                logger.info(f"  ℹ No se encontró mapeo para '{codigo_original}', usando código original")
+            if mapeo_encontrado:
+                logger.info("  ✓ Mapeo encontrado: '%s' → '%s'", codigo_original, codigo_final)
+            else:
+                logger.info("  ℹ No se encontró mapeo para '%s', usando código original", codigo_original)
 
-            logger.info(f"  Se usará código de sucursal: '{codigo_final}'")
+            logger.info("  Se usará código de sucursal: '%s'", codigo_final)
             return {
                 'encontrado': True,
                 'codigo_sucursal': codigo_final
@@ -316,336 +704,605 @@ def _detectar_servitotal_en_correo(body_text, logger):
         return {'encontrado': False, 'codigo_sucursal': None}
 
     except Exception as e:
-        logger.error(f"Error al detectar servitotal en correo: {str(e)}")
+        logger.error("Error al detectar servitotal en correo: %s", e)
         import traceback
         traceback.print_exc()
         return {'encontrado': False, 'codigo_sucursal': None}
 
 
-def _extract_attachments(email_message, logger):
-    """Extrae los archivos adjuntos de un email"""
+def _analyze_body(body_text, logger):
+    """
+    Ejecuta las detecciones del cuerpo (garantía, proveedor, servitotal)
+
+    El cuerpo se convierte a mayúsculas una sola vez y se comparte entre los tres
+    detectores, en lugar de que cada uno genere su propia copia. Cada detector
+    descarta primero con búsquedas de literales (str.find, en C) los cuerpos que no
+    pueden coincidir, antes de ejecutar su expresión regular.
+
+    Retorna:
+        dict con las claves 'garantia', 'proveedor' y 'servitotal'
+    """
+    body_upper = body_text.upper()
+    return {
+        'garantia': _detectar_garantia_en_correo(body_upper, logger),
+        'proveedor': _detectar_proveedor_en_correo(body_upper, logger),
+        'servitotal': _detectar_servitotal_en_correo(body_upper, logger),
+    }
+
+
+def _save_attachment(part, logger):
+    """
+    Escribe una parte adjunta en un archivo temporal
+
+    Retorna el diccionario {'filename', 'path', 'content_type'} o None si la parte
+    no trae nombre de archivo o viene vacía.
+    """
+    filename = part.get_filename()
+    if not filename:
+        return None
+
+    filename = _decode_header_value(filename, logger)
+    file_data = part.get_payload(decode=True)
+    if not file_data:
+        return None
+
+    content_type = part.get_content_type()
+    file_size_kb = len(file_data) / 1024
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tf:
+        tf.write(file_data)
+
+    logger.info("📎 Adjunto encontrado: %s | Tipo: %s | Tamaño: %.2f KB", filename, content_type, file_size_kb)
+
+    return {
+        'filename': filename,
+        'path': tf.name,
+        'content_type': content_type
+    }
+
+
+def _log_attachment_total(attachments, logger):
+    """Registra cuántos adjuntos se extrajeron del correo"""
+    if attachments:
+        logger.info("✅ Total de adjuntos extraídos: %d", len(attachments))
+    else:
+        logger.info("ℹ️ No se encontraron adjuntos en el correo")
+
+
+# Tamaño de los bloques con que se alimenta el parser de mensajes completos
+_FEED_CHUNK_SIZE = 64 * 1024
+
+
+def _parse_message_bytes(raw_email):
+    """
+    Construye el EmailMessage a partir del RFC822 descargado
+
+    El parser se alimenta por bloques de _FEED_CHUNK_SIZE tomados de un memoryview,
+    en lugar de convertir el mensaje completo de una vez: en correos con adjuntos
+    grandes se evita duplicar todo el contenido en una sola cadena intermedia.
+    """
+    parser = BytesFeedParser(policy=_EMAIL_POLICY)
+    view = memoryview(raw_email)
+    for start in range(0, len(view), _FEED_CHUNK_SIZE):
+        parser.feed(bytes(view[start:start + _FEED_CHUNK_SIZE]))
+    return parser.close()
+
+
+def _parse_email(email_message, logger):
+    """
+    Recorre el árbol MIME una sola vez y obtiene el cuerpo y los adjuntos
+
+    El cuerpo completo (todas las partes text/plain que no son adjuntos) va al caso;
+    para las detecciones (garantía, proveedor, servitotal) basta la primera de esas
+    partes, el resto suelen ser textos reenviados. Cada adjunto se escribe en un archivo
+    temporal y el diccionario guarda su ruta en 'path' en lugar de los bytes.
+
+    Retorna:
+        tupla (body_text, detection_text, attachments); los adjuntos se liberan con
+        _cleanup_attachment_files
+    """
+    if not email_message.is_multipart():
+        logger.info("ℹ️ El correo no tiene adjuntos (no es multipart)")
+        body_text = _decode_part_text(email_message)
+        return body_text, body_text, []
+
+    logger.info("📎 Extrayendo archivos adjuntos del correo...")
+    texts = []
     attachments = []
 
     try:
-        logger.info("📎 Extrayendo archivos adjuntos del correo...")
+        for part in email_message.walk():
+            # Los contenedores multipart/* no traen contenido propio
+            if part.get_content_maintype() == 'multipart':
+                continue
+            if part.get_content_disposition() == 'attachment':
+                attachment = _save_attachment(part, logger)
+                if attachment:
+                    attachments.append(attachment)
+            elif part.get_content_type() == "text/plain":
+                # Imágenes en línea y demás partes que no son adjuntos no se decodifican
+                text = _decode_part_text(part)
+                if text:
+                    texts.append(text)
+    except Exception as e:
+        logger.error("❌ Error extrayendo adjuntos: %s", e)
+        _cleanup_attachment_files(attachments)
+        return "".join(texts), texts[0] if texts else "", []
 
-        if not email_message.is_multipart():
-            logger.info("ℹ️ El correo no tiene adjuntos (no es multipart)")
-            return attachments
+    _log_attachment_total(attachments, logger)
+    return "".join(texts), texts[0] if texts else "", attachments
 
-        for part in email_message.walk():
-            content_disposition = str(part.get("Content-Disposition", ""))
 
-            if "attachment" in content_disposition:
-                filename = part.get_filename()
+def _flatten_message(msg):
+    """
+    Serializa el mensaje a bytes en una sola pasada para smtplib.sendmail
 
-                if filename:
-                    filename = _decode_header_value(filename)
-                    file_data = part.get_payload(decode=True)
+    Los adjuntos ya llegan codificados en base64 desde _attach_file, así que el
+    generador solo copia sus líneas al buffer.
+    """
+    buf = io.BytesIO()
+    BytesGenerator(buf, mangle_from_=False, policy=msg.policy).flatten(msg)
+    return buf.getvalue()
 
-                    if file_data:
-                        content_type = part.get_content_type()
-                        file_size_kb = len(file_data) / 1024
 
-                        attachments.append({
-                            'filename': filename,
-                            'data': file_data,
-                            'content_type': content_type
-                        })
+def _build_message(email_addr, to, subject, body, cc_list=None, attachments=None, logger=None):
+    """
+    Arma el EmailMessage (cuerpo de texto + adjuntos) listo para serializar
 
-                        logger.info(
-                            f"📎 Adjunto encontrado: {filename} | Tipo: {content_type} | Tamaño: {file_size_kb:.2f} KB")
+    Con to=None el mensaje queda sin encabezado To: sirve de plantilla para enviar
+    el mismo contenido a varios destinatarios (ver _to_header_bytes).
+    """
+    # API moderna de email: evita la capa compat32 de MIMEMultipart/MIMEText
+    msg = EmailMessage(policy=policy.SMTP)
+    msg['From'] = _sanitize_string(email_addr)
+    if to:
+        msg['To'] = to
+    msg['Subject'] = subject
 
-        if attachments:
-            logger.info(f"✅ Total de adjuntos extraídos: {len(attachments)}")
-        else:
-            logger.info("ℹ️ No se encontraron adjuntos en el correo")
+    if cc_list:
+        msg['Cc'] = ", ".join(cc_list)
 
-        return attachments
+    msg.set_content(body)
 
-    except Exception as e:
-        logger.error(f"❌ Error extrayendo adjuntos: {str(e)}")
-        return []
+    for attachment in attachments or ():
+        _attach_file(msg, attachment, logger)
 
+    return msg
 
-def _attach_file(msg, attachment):
-    """Adjunta un archivo al mensaje MIME"""
-    try:
-        filename = attachment.get('filename', 'archivo_adjunto')
-        file_data = attachment.get('data')
 
-        if not file_data:
-            print(f"No hay datos para el archivo {filename}")
-            return
+def _to_header_bytes(to):
+    """Encabezado To ya plegado y codificado (RFC 2047) para anteponerlo a una plantilla"""
+    return policy.SMTP.fold_binary(*policy.SMTP.header_store_parse('To', to))
 
-        part = MIMEBase('application', 'octet-stream')
-        part.set_payload(file_data)
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f'attachment; filename= {filename}')
 
-        msg.attach(part)
+class _SMTPBodySentError(smtplib.SMTPDataError):
+    """
+    Error después de enviar el cuerpo del mensaje (tras el punto final de DATA)
 
-    except Exception as e:
-        print(f"Error al adjuntar archivo {attachment.get('filename', 'desconocido')}: {str(e)}")
+    El servidor pudo haber encolado el mensaje antes de fallar, así que no se reintenta:
+    se arriesgaría a entregarlo dos veces.
+    """
 
 
-def _generate_formatted_text_for_cc(data):
-    """Genera el archivo de texto formateado con los datos extraídos del PDF"""
-    from datetime import datetime
-
-    lines = ["=" * 80, "BOLETA DE REPARACIÓN - INFORMACIÓN PROCESADA", "=" * 80, ""]
-
-    if any(k in data for k in ['numero_transaccion', 'numero_boleta', 'fecha', 'gestionada_por']):
-        lines.append("INFORMACIÓN DE LA TRANSACCIÓN")
-        lines.append("-" * 80)
-        if 'numero_transaccion' in data:
-            lines.append(f"Número de Transacción: {data['numero_transaccion']}")
-        if 'numero_boleta' in data:
-            lines.append(f"Número de Boleta: {data['numero_boleta']}")
-        if 'fecha' in data:
-            lines.append(f"Fecha: {data['fecha']}")
-        if 'gestionada_por' in data:
-            lines.append(f"Gestionada por: {data['gestionada_por']}")
-        lines.append("")
-
-    if any(k in data for k in ['sucursal', 'telefono_sucursal']):
-        lines.append("INFORMACIÓN DE LA SUCURSAL")
-        lines.append("-" * 80)
-        if 'sucursal' in data:
-            lines.append(f"Sucursal: {data['sucursal']}")
-        if 'telefono_sucursal' in data:
-            lines.append(f"Teléfono: {data['telefono_sucursal']}")
-        lines.append("")
-
-    cliente_keys = ['nombre_cliente', 'nombre_contacto', 'cedula_cliente', 'telefono_cliente',
-                    'telefono_adicional', 'correo_cliente', 'direccion_cliente']
-    if any(k in data for k in cliente_keys):
-        lines.append("INFORMACIÓN DEL CLIENTE")
-        lines.append("-" * 80)
-        # Solo mostrar el nombre una vez (priorizar nombre_cliente sobre nombre_contacto)
-        if 'nombre_cliente' in data:
-            lines.append(f"Nombre: {data['nombre_cliente']}")
-        elif 'nombre_contacto' in data:
-            lines.append(f"Nombre: {data['nombre_contacto']}")
-        if 'cedula_cliente' in data:
-            lines.append(f"Cédula: {data['cedula_cliente']}")
-        if 'telefono_cliente' in data:
-            lines.append(f"Teléfono: {data['telefono_cliente']}")
-        if 'telefono_adicional' in data:
-            lines.append(f"Teléfono Adicional: {data['telefono_adicional']}")
-        if 'correo_cliente' in data:
-            lines.append(f"Correo: {data['correo_cliente']}")
-        # NUEVO: Mostrar cómo se extrajo el correo con OCR (para diagnóstico)
-        if 'correo_ocr_raw' in data:
-            lines.append(f"Correo (OCR Raw): {data['correo_ocr_raw']}")
-        if 'direccion_cliente' in data:
-            lines.append(f"Dirección: {data['direccion_cliente']}")
-        lines.append("")
-
-    producto_keys = ['codigo_producto', 'descripcion_producto', 'marca',
-                     'modelo', 'serie', 'garantia', 'codigo_distribuidor']
-    if any(k in data for k in producto_keys):
-        lines.append("INFORMACIÓN DEL PRODUCTO")
-        lines.append("-" * 80)
-        if 'codigo_producto' in data:
-            lines.append(f"Código: {data['codigo_producto']}")
-        if 'descripcion_producto' in data:
-            lines.append(f"Descripción: {data['descripcion_producto']}")
-        if 'marca' in data:
-            lines.append(f"Marca: {data['marca']}")
-        if 'modelo' in data:
-            lines.append(f"Modelo: {data['modelo']}")
-        if 'garantia' in data:
-            lines.append(f"Garantía: {data['garantia']}")
-        if 'serie' in data:
-            lines.append(f"Serie: {data['serie']}")
-        if 'codigo_distribuidor' in data:
-            lines.append(f"Código Distribuidor: {data['codigo_distribuidor']}")
-        lines.append("")
-
-    compra_keys = ['numero_factura', 'fecha_compra', 'fecha_garantia',
-                   'tipo_garantia', 'distribuidor']
-    if any(k in data for k in compra_keys):
-        lines.append("INFORMACIÓN DE COMPRA")
-        lines.append("-" * 80)
-        if 'numero_factura' in data:
-            lines.append(f"Número de Factura: {data['numero_factura']}")
-        if 'fecha_compra' in data:
-            lines.append(f"Fecha de Compra: {data['fecha_compra']}")
-        if 'fecha_garantia' in data:
-            lines.append(f"Fecha de Garantía: {data['fecha_garantia']}")
-        if 'tipo_garantia' in data:
-            lines.append(f"Tipo de Garantía: {data['tipo_garantia']}")
-        if 'distribuidor' in data:
-            lines.append(f"Distribuidor: {data['distribuidor']}")
-        lines.append("")
-
-    if any(k in data for k in ['hecho_por', 'danos', 'observaciones']):
-        lines.append("INFORMACIÓN TÉCNICA")
-        lines.append("-" * 80)
-        if 'hecho_por' in data:
-            lines.append(f"Hecho por: {data['hecho_por']}")
-        if 'danos' in data:
-            lines.append(f"Daños Reportados: {data['danos']}")
-        if 'observaciones' in data:
-            lines.append(f"Observaciones: {data['observaciones']}")
-        lines.append("")
-
-    lines.append("=" * 80)
-    lines.append("Documento procesado automáticamente por GolloBot")
-    lines.append(f"Fecha de procesamiento: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    lines.append("=" * 80)
-
-    return "\n".join(lines)
-
-
-def _generate_console_format_data_text(preingreso_results):
+class _PipelinedSMTP(smtplib.SMTP):
     """
-    Genera el archivo de texto con el formato de consola (igual que se ve en el terminal)
+    smtplib.SMTP con ESMTP PIPELINING (RFC 2920) en sendmail
 
-    Args:
-        preingreso_results: Lista con resultados del preingreso que incluyen datos_pdf_raw y datos_api_raw
+    Si el servidor anuncia PIPELINING, MAIL FROM, los RCPT TO y DATA se escriben
+    juntos y luego se leen sus respuestas en orden: un viaje de ida y vuelta en lugar
+    de uno por comando; sin PIPELINING se envían de a uno. Los errores se reportan
+    con las mismas excepciones que smtplib.SMTP.sendmail, salvo los que ocurren ya
+    enviado el cuerpo, que se reportan con _SMTPBodySentError.
+    """
 
-    Returns:
-        str: Contenido del archivo con formato de consola
+    def _abort_data(self, data_code):
+        """Cierra un DATA ya aceptado (354) sin enviar contenido"""
+        if data_code == 354:
+            self.send(b"." + smtplib.bCRLF)
+            self.getreply()
+
+    def _reset_transaction(self, code):
+        """
+        Deja la conexión lista para otro envío tras un error, o la cierra
+
+        Con 421 el servidor va a cerrar la conexión; si RSET falla tampoco se puede
+        reutilizar. Una conexión cerrada no vuelve al pool (ver _checkin_smtp).
+        """
+        if code == 421:
+            self.close()
+            return
+        try:
+            if self.rset()[0] == 250:
+                return
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.close()
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        self.ehlo_or_helo_if_needed()
+        if mail_options or rcpt_options:
+            return super().sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        if isinstance(msg, str):
+            msg = smtplib._fix_eols(msg).encode('ascii')
+
+        size_opt = f" SIZE={len(msg)}" if self.has_extn('size') else ""
+        commands = [f"MAIL FROM:{smtplib.quoteaddr(from_addr)}{size_opt}"]
+        commands.extend(f"RCPT TO:{smtplib.quoteaddr(addr)}" for addr in to_addrs)
+        commands.append("DATA")
+        if self.has_extn('pipelining'):
+            # Las respuestas llegan en el mismo orden en que se enviaron los comandos
+            self.send("".join(cmd + smtplib.CRLF for cmd in commands))
+            replies = [self.getreply() for _ in commands]
+        else:
+            replies = []
+            for cmd in commands:
+                self.send(cmd + smtplib.CRLF)
+                replies.append(self.getreply())
+
+        mail_code, mail_resp = replies[0]
+        rcpt_replies = replies[1:-1]
+        data_code, data_resp = replies[-1]
+
+        if mail_code != 250:
+            self._abort_data(data_code)
+            self._reset_transaction(mail_code)
+            raise smtplib.SMTPSenderRefused(mail_code, mail_resp, from_addr)
+
+        senderrs = {}
+        for addr, (code, resp) in zip(to_addrs, rcpt_replies):
+            if code == 421:
+                self.close()
+                raise smtplib.SMTPRecipientsRefused({addr: (code, resp)})
+            if code not in (250, 251):
+                senderrs[addr] = (code, resp)
+
+        if len(senderrs) == len(to_addrs):
+            # Ningún destinatario aceptado: no se envía el cuerpo
+            self._abort_data(data_code)
+            self._reset_transaction(data_code)
+            raise smtplib.SMTPRecipientsRefused(senderrs)
+
+        if data_code != 354:
+            self._reset_transaction(data_code)
+            raise smtplib.SMTPDataError(data_code, data_resp)
+
+        q = smtplib._quote_periods(msg)
+        if q[-2:] != smtplib.bCRLF:
+            q += smtplib.bCRLF
+        try:
+            self.send(q + b"." + smtplib.bCRLF)
+            code, resp = self.getreply()
+        except smtplib.SMTPServerDisconnected as e:
+            raise _SMTPBodySentError(-1, str(e)) from e
+        if code != 250:
+            self._reset_transaction(code)
+            raise _SMTPBodySentError(code, resp)
+        return senderrs
+
+
+# Respuestas SMTP temporales: conviene reintentar más tarde en lugar de descartar el envío
+_SMTP_TRANSIENT_CODES = frozenset((421, 450, 454))
+
+
+def _is_transient_smtp_error(error):
+    """Indica si el error SMTP es temporal (código 421/450/454)"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code in _SMTP_TRANSIENT_CODES
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return any(code in _SMTP_TRANSIENT_CODES for code, _ in error.recipients.values())
+    return False
+
+
+def _close_smtp(smtp):
+    """Cierra una conexión SMTP ignorando errores (puede estar ya caída)"""
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
+
+
+def _pool_key(*parts, password):
     """
-    from datetime import datetime
+    Clave de los pools de conexiones
 
-    lines = ["=" * 80, "DATOS DE PROCESAMIENTO - FORMATO CONSOLA", "=" * 80, ""]
+    Incluye un hash de la contraseña: tras un cambio de contraseña no se reutiliza una
+    sesión autenticada con la anterior.
+    """
+    return parts + (hashlib.sha256(password.encode('utf-8')).hexdigest(),)
 
-    if not preingreso_results or len(preingreso_results) == 0:
-        lines.append("No hay información disponible.")
-        lines.append("")
-        lines.append("=" * 80)
-        return "\n".join(lines)
 
-    # Tomar el primer resultado (normalmente solo hay uno)
-    result = preingreso_results[0]
+def _logout_imap(imap):
+    """Cierra una sesión IMAP ignorando errores (puede estar ya caída)"""
+    try:
+        imap.logout()
+    except (imaplib.IMAP4.error, OSError):
+        pass
 
-    # Agregar datos del PDF en formato raw (tal como se ve en consola)
-    datos_pdf_raw = result.get('datos_pdf_raw')
-    if datos_pdf_raw:
-        lines.append("🏷️Datos del PDF:")
-        lines.append(datos_pdf_raw)
-        lines.append("")
-    else:
-        lines.append("🏷️Datos del PDF:")
-        lines.append("No disponibles")
-        lines.append("")
 
-    # Agregar datos enviados a la API en formato raw (tal como se ve en consola)
-    datos_api_raw = result.get('datos_api_raw')
-    if datos_api_raw:
-        lines.append("🏷️Datos que serán enviados:")
-        lines.append(datos_api_raw)
-        lines.append("")
-    else:
-        lines.append("🏷️Datos que serán enviados:")
-        lines.append("No disponibles")
-        lines.append("")
+def _cleanup_attachment_files(attachments):
+    """Elimina los archivos temporales creados por _parse_email"""
+    for attachment in attachments:
+        path = attachment.get('path')
+        if path:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
 
-    lines.append("=" * 80)
-    lines.append("Documento generado automáticamente por GolloBot")
-    lines.append(f"Fecha de generación: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    lines.append("=" * 80)
 
-    return "\n".join(lines)
+# Bloque de lectura para codificar adjuntos: múltiplo de 57 bytes, lo que ocupa una
+# línea base64 de 76 caracteres, para que los bloques no partan líneas
+_B64_READ_BLOCK = 57 * 1024
 
 
-def _generate_api_sent_data_text(preingreso_results):
-    """Genera el texto formateado con los datos que fueron enviados al API"""
-    from datetime import datetime
+def _encode_base64_stream(stream):
+    """
+    Codifica en base64 (líneas de 76 caracteres) un flujo binario leyéndolo por bloques
 
-    lines = ["=" * 80, "DATOS ENVIADOS AL SISTEMA iFR Pro", "=" * 80, ""]
+    El resultado es el mismo que produce set_content con los bytes completos, pero sin
+    la lista de una cadena por línea que arma el contentmanager ni una copia completa
+    de los datos originales junto a su versión codificada.
+    """
+    out = io.StringIO()
+    for block in iter(lambda: stream.read(_B64_READ_BLOCK), b''):
+        out.write(base64.encodebytes(block).decode('ascii'))
+    return out.getvalue()
 
-    if not preingreso_results or len(preingreso_results) == 0:
-        lines.append("No hay información disponible sobre los datos enviados al sistema.")
-        lines.append("")
-        lines.append("=" * 80)
-        return "\n".join(lines)
 
-    # Tomar el primer resultado (normalmente solo hay uno)
-    result = preingreso_results[0]
+def _build_attachment_part(attachment, logger=None):
+    """
+    Devuelve la parte MIME (base64) de un adjunto, codificándola solo la primera vez
 
-    lines.append("RESULTADO DE LA CREACIÓN DEL PREINGRESO")
-    lines.append("-" * 80)
+    El adjunto puede traer sus bytes en 'data' o la ruta de un archivo en 'path';
+    en el segundo caso el archivo se codifica leyéndolo por bloques al momento de
+    adjuntarlo (_encode_base64_stream), sin cargarlo completo en memoria.
 
-    if result.get('preingreso_id'):
-        lines.append(f"ID Preingreso (Boleta Fruno): {result['preingreso_id']}")
+    La parte ya codificada se guarda en attachment['_encoded_part'], así el mismo
+    adjunto enviado a varios destinatarios (o reintentado) no se vuelve a codificar.
+    Devuelve None si el adjunto no tiene datos.
+    """
+    part = attachment.get('_encoded_part')
+    if part is not None:
+        return part
+
+    filename = attachment.get('filename', 'archivo_adjunto')
+    file_data = attachment.get('data')
+    path = attachment.get('path')
+
+    if not file_data and not (path and os.path.getsize(path)):
+        (logger or _log).warning("No hay datos para el archivo %s", filename)
+        return None
+
+    # Encabezados iguales a los de set_content; el payload se codifica aparte por bloques
+    part = MIMEPart(policy=_EMAIL_POLICY)
+    part.set_content(b'', maintype='application', subtype='octet-stream', cte='base64',
+                     disposition='attachment', filename=filename)
+    if file_data:
+        # BytesIO sobre bytes comparte el buffer: no copia los datos del adjunto
+        part.set_payload(_encode_base64_stream(io.BytesIO(file_data)))
+    else:
+        with open(path, 'rb') as f:
+            part.set_payload(_encode_base64_stream(f))
+    attachment['_encoded_part'] = part
+    return part
 
-    if result.get('boleta'):
-        lines.append(f"Número de Boleta Gollo: {result['boleta']}")
 
-    if result.get('numero_transaccion'):
-        lines.append(f"Número de Transacción: {result['numero_transaccion']}")
+def _attach_file(msg, attachment, logger=None):
+    """
+    Adjunta un archivo a un EmailMessage
 
-    if result.get('tipo_preingreso_nombre'):
-        lines.append(f"Tipo de Preingreso: {result['tipo_preingreso_nombre']}")
+    Usa la parte MIME cacheada por _build_attachment_part: los envíos siguientes
+    del mismo adjunto solo adjuntan una copia superficial.
+    """
+    try:
+        part = _build_attachment_part(attachment, logger)
+        if part is None:
+            return
 
-    if result.get('garantia_nombre'):
-        lines.append(f"Garantía Aplicada: {result['garantia_nombre']}")
+        # El primer adjunto convierte el cuerpo de texto en multipart/mixed
+        if not msg.is_multipart():
+            msg.make_mixed()
 
-    # Indicar si la garantía viene del correo
-    if result.get('garantia_viene_de_correo'):
-        lines.append(f"Origen de Garantía: Detectada en el cuerpo del correo")
+        # Copia superficial: el payload base64 ya codificado se comparte entre mensajes
+        msg.attach(copy.copy(part))
 
-    lines.append("")
+    except Exception as e:
+        (logger or _log).error("Error al adjuntar archivo %s: %s", attachment.get('filename', 'desconocido'), e,
+                               exc_info=True)
+
+
+# Separadores de los archivos de texto y del log
+_SEP80 = "=" * 80
+_DASH80 = "-" * 80
+
+
+# Secciones del texto para CC: (título, claves que activan la sección, campos).
+# Cada campo es (claves, etiqueta); si hay varias claves se usa la primera presente
+_CC_TEXT_SECTIONS = (
+    ("INFORMACIÓN DE LA TRANSACCIÓN",
+     ('numero_transaccion', 'numero_boleta', 'fecha', 'gestionada_por'),
+     ((('numero_transaccion',), "Número de Transacción"),
+      (('numero_boleta',), "Número de Boleta"),
+      (('fecha',), "Fecha"),
+      (('gestionada_por',), "Gestionada por"))),
+    ("INFORMACIÓN DE LA SUCURSAL",
+     ('sucursal', 'telefono_sucursal'),
+     ((('sucursal',), "Sucursal"),
+      (('telefono_sucursal',), "Teléfono"))),
+    ("INFORMACIÓN DEL CLIENTE",
+     ('nombre_cliente', 'nombre_contacto', 'cedula_cliente', 'telefono_cliente',
+      'telefono_adicional', 'correo_cliente', 'direccion_cliente'),
+     # Solo mostrar el nombre una vez (priorizar nombre_cliente sobre nombre_contacto)
+     ((('nombre_cliente', 'nombre_contacto'), "Nombre"),
+      (('cedula_cliente',), "Cédula"),
+      (('telefono_cliente',), "Teléfono"),
+      (('telefono_adicional',), "Teléfono Adicional"),
+      (('correo_cliente',), "Correo"),
+      # Cómo se extrajo el correo con OCR (para diagnóstico)
+      (('correo_ocr_raw',), "Correo (OCR Raw)"),
+      (('direccion_cliente',), "Dirección"))),
+    ("INFORMACIÓN DEL PRODUCTO",
+     ('codigo_producto', 'descripcion_producto', 'marca',
+      'modelo', 'serie', 'garantia', 'codigo_distribuidor'),
+     ((('codigo_producto',), "Código"),
+      (('descripcion_producto',), "Descripción"),
+      (('marca',), "Marca"),
+      (('modelo',), "Modelo"),
+      (('garantia',), "Garantía"),
+      (('serie',), "Serie"),
+      (('codigo_distribuidor',), "Código Distribuidor"))),
+    ("INFORMACIÓN DE COMPRA",
+     ('numero_factura', 'fecha_compra', 'fecha_garantia', 'tipo_garantia', 'distribuidor'),
+     ((('numero_factura',), "Número de Factura"),
+      (('fecha_compra',), "Fecha de Compra"),
+      (('fecha_garantia',), "Fecha de Garantía"),
+      (('tipo_garantia',), "Tipo de Garantía"),
+      (('distribuidor',), "Distribuidor"))),
+    ("INFORMACIÓN TÉCNICA",
+     ('hecho_por', 'danos', 'observaciones'),
+     ((('hecho_por',), "Hecho por"),
+      (('danos',), "Daños Reportados"),
+      (('observaciones',), "Observaciones"))),
+)
+
+
+def _generate_formatted_text_for_cc(data, now_str=None):
+    """Genera el archivo de texto formateado con los datos extraídos del PDF"""
+    if now_str is None:
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    out = io.StringIO()
+    w = out.write
+    w(_SEP80 + "\n")
+    w("BOLETA DE REPARACIÓN - INFORMACIÓN PROCESADA\n")
+    w(_SEP80 + "\n")
+    w("\n")
+
+    for title, trigger_keys, fields in _CC_TEXT_SECTIONS:
+        if not any(k in data for k in trigger_keys):
+            continue
+        w(title + "\n")
+        w(_DASH80 + "\n")
+        for keys, label in fields:
+            # Con varias claves se muestra solo la primera presente
+            for k in keys:
+                if k in data:
+                    w(f"{label}: {data[k]}\n")
+                    break
+        w("\n")
 
-    # Enlaces de consulta
-    if result.get('consultar_reparacion') or result.get('consultar_guia'):
-        lines.append("ENLACES DE CONSULTA")
-        lines.append("-" * 80)
+    w(_SEP80 + "\n")
+    w("Documento procesado automáticamente por GolloBot\n")
+    w(f"Fecha de procesamiento: {now_str}\n")
+    w(_SEP80 + "\n")
 
-        if result.get('consultar_reparacion'):
-            lines.append(f"Consultar Estado de Reparación:")
-            lines.append(f"  {result['consultar_reparacion']}")
+    return out.getvalue().rstrip("\n")
 
-        if result.get('consultar_guia'):
-            lines.append(f"Consultar Guía:")
-            lines.append(f"  {result['consultar_guia']}")
 
-        lines.append("")
+def _generate_console_format_data_text(preingreso_results, now_str=None):
+    """
+    Genera el archivo de texto con el formato de consola (igual que se ve en el terminal)
 
-    # Información adicional del resultado
-    if result.get('extracted_data'):
-        extracted = result['extracted_data']
+    Args:
+        preingreso_results: Lista con resultados del preingreso que incluyen datos_pdf_raw y datos_api_raw
+        now_str: Fecha de generación ya formateada; si no se indica se toma la hora actual
 
-        lines.append("DATOS ADICIONALES ENVIADOS")
-        lines.append("-" * 80)
+    Returns:
+        str: Contenido del archivo con formato de consola
+    """
+    if now_str is None:
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        if extracted.get('nombre_cliente') or extracted.get('nombre_contacto'):
-            nombre = extracted.get('nombre_cliente') or extracted.get('nombre_contacto')
-            lines.append(f"Cliente: {nombre}")
+    out = io.StringIO()
+    w = out.write
+    w(_SEP80 + "\n")
+    w("DATOS DE PROCESAMIENTO - FORMATO CONSOLA\n")
+    w(_SEP80 + "\n")
+    w("\n")
 
-        if extracted.get('correo_cliente'):
-            lines.append(f"Correo Cliente: {extracted['correo_cliente']}")
+    if not preingreso_results or len(preingreso_results) == 0:
+        w("No hay información disponible.\n")
+        w("\n")
+        w(_SEP80 + "\n")
+        return out.getvalue().rstrip("\n")
 
-        if extracted.get('telefono_cliente'):
-            lines.append(f"Teléfono Cliente: {extracted['telefono_cliente']}")
+    # Tomar el primer resultado (normalmente solo hay uno)
+    result = preingreso_results[0]
 
-        if extracted.get('serie'):
-            lines.append(f"Serie del Producto: {extracted['serie']}")
+    # Agregar datos del PDF en formato raw (tal como se ve en consola)
+    datos_pdf_raw = result.get('datos_pdf_raw')
+    if datos_pdf_raw:
+        w("🏷️Datos del PDF:\n")
+        w(datos_pdf_raw + "\n")
+        w("\n")
+    else:
+        w("🏷️Datos del PDF:\n")
+        w("No disponibles\n")
+        w("\n")
 
-        if extracted.get('marca'):
-            lines.append(f"Marca: {extracted['marca']}")
+    # Agregar datos enviados a la API en formato raw (tal como se ve en consola)
+    datos_api_raw = result.get('datos_api_raw')
+    if datos_api_raw:
+        w("🏷️Datos que serán enviados:\n")
+        w(datos_api_raw + "\n")
+        w("\n")
+    else:
+        w("🏷️Datos que serán enviados:\n")
+        w("No disponibles\n")
+        w("\n")
 
-        if extracted.get('modelo'):
-            lines.append(f"Modelo: {extracted['modelo']}")
+    w(_SEP80 + "\n")
+    w("Documento generado automáticamente por GolloBot\n")
+    w(f"Fecha de generación: {now_str}\n")
+    w(_SEP80 + "\n")
 
-        if extracted.get('descripcion_producto'):
-            lines.append(f"Descripción del Producto: {extracted['descripcion_producto']}")
+    return out.getvalue().rstrip("\n")
 
-        lines.append("")
 
-    lines.append("=" * 80)
-    lines.append("Datos enviados exitosamente al sistema iFR Pro")
-    lines.append(f"Fecha de envío: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    lines.append("=" * 80)
+def _generate_cc_text_bundle(extracted_data, preingreso_results):
+    """
+    Genera los dos archivos de texto de las notificaciones CC en un solo paso
 
-    return "\n".join(lines)
+    Returns:
+        tupla (texto_datos_extraídos, texto_formato_consola), ambos con la misma
+        fecha de generación
+    """
+    now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return (_generate_formatted_text_for_cc(extracted_data, now_str),
+            _generate_console_format_data_text(preingreso_results, now_str))
 
 
 class EmailManager:
+    # Correos procesados en paralelo por check_and_process_emails. Solo se solapa la parte de
+    # E/S (decodificar el MIME, enviar la respuesta SMTP): la ejecución del caso va de a una
+    # (ver _case_lock)
+    MAX_PROCESSING_WORKERS = 4
+
+    # Mensajes por cada FETCH: un lote cuesta un solo viaje de ida y vuelta al servidor,
+    # pero un lote demasiado grande de RFC822 completos acumula mucha memoria
+    FETCH_BATCH_SIZE = 100
+
+    # Hilos para enviar en paralelo las copias a usuarios CC, cada uno con su conexión SMTP
+    MAX_CC_SEND_WORKERS = 5
+
+    # Conexiones SMTP simultáneas por cuenta, sumando todos los hilos (procesamiento y CC).
+    # Gmail limita a unas 15 por cuenta y responde 421/454 al superarlo; el margen queda
+    # para otros clientes de la misma cuenta. Debe ser mayor que MAX_PROCESSING_WORKERS:
+    # cada worker de procesamiento retiene su conexión mientras espera a sus hilos CC.
+    SMTP_MAX_SESSIONS = 10
+
+    # Reintentos ante respuestas SMTP temporales (421/450/454): espera base * 2^intento segundos
+    SMTP_MAX_RETRIES = 3
+    SMTP_BACKOFF_BASE = 0.5
+
+    # MTA local para el envío (opción use_local_relay): sin TLS ni autenticación, la cola,
+    # los reintentos y la resolución DNS quedan a cargo del MTA, no de este proceso
+    LOCAL_RELAY_SERVER = '127.0.0.1'
+    LOCAL_RELAY_PORT = 25
+
     def __init__(self):
         """Inicializa el gestor de correo electrónico"""
         self.provider_configs = {
@@ -675,38 +1332,258 @@ class EmailManager:
             }
         }
 
+        # Envío por un MTA local (Postfix/sendmail) en loopback en lugar del SMTP del proveedor:
+        # recomendado cuando el volumen de respuestas es alto. Solo afecta el envío; la lectura
+        # sigue por el IMAP del proveedor. Ver _smtp_endpoint.
+        self.use_local_relay = False
+
         self.case_handler = CaseHandler()
 
+        # Los casos no son thread-safe: PyMuPDF (fitz) no admite uso concurrente, cada
+        # ejecución crea su propio lector OCR y la verificación de boletas duplicadas
+        # debe ver el resultado del correo anterior. Por eso se ejecutan de a uno.
+        self._case_lock = threading.Lock()
+
+        # Conexiones SMTP autenticadas libres, por (proveedor, cuenta). Cada envío toma una
+        # conexión en exclusiva (smtplib no es thread-safe) y la devuelve al terminar.
+        self._smtp_pool = {}
+        self._smtp_pool_lock = threading.Lock()
+
+        # Cupos de conexiones SMTP en uso por clave de pool (SMTP_MAX_SESSIONS cada uno).
+        # Un hilo que ya tiene un cupo no toma otro (_smtp_held): si su conexión se cae y
+        # abre una nueva mientras la anterior sigue tomada, no se bloquea a sí mismo.
+        self._smtp_slots = {}
+        self._smtp_held = threading.local()
+
+        # Sesión IMAP autenticada por (proveedor, cuenta), reutilizada entre ciclos de monitoreo
+        self._imap_pool = {}
+        self._imap_pool_lock = threading.Lock()
+
     def get_provider_config(self, provider):
         """Obtiene la configuración para un proveedor específico"""
         return self.provider_configs.get(provider, self.provider_configs['Otro'])
 
-    def test_smtp_connection(self, provider, email_addr, password):
+    def _smtp_endpoint(self, provider, local_relay=None):
+        """
+        Servidor y puerto SMTP para el envío: el MTA local si está activado, si no el del proveedor
+
+        local_relay permite probar la opción sin guardarla (None = usar use_local_relay).
+        """
+        if local_relay is None:
+            local_relay = self.use_local_relay
+        if local_relay:
+            return self.LOCAL_RELAY_SERVER, self.LOCAL_RELAY_PORT
+
+        config = self.get_provider_config(provider)
+        return config['smtp_server'], config['smtp_port']
+
+    def _connect_smtp(self, server, port, email_addr, password, logger):
+        """Abre una conexión SMTP nueva: EHLO, STARTTLS y LOGIN (salvo MTA local)"""
+        logger.info("📧 Conectando al servidor SMTP: %s:%s", server, port)
+        smtp = _PipelinedSMTP(server, port)
+        try:
+            smtp.ehlo()
+            if _is_loopback_host(server):
+                logger.info("📮 MTA local: envío sin TLS ni autenticación")
+            else:
+                logger.info("🔐 Estableciendo conexión segura (TLS)...")
+                smtp.starttls(context=ssl.create_default_context())
+                smtp.ehlo()
+                logger.info("🔐 Autenticando cuenta: %s", email_addr)
+                smtp.login(email_addr, password)
+        except Exception:
+            _close_smtp(smtp)
+            raise
+        return smtp
+
+    def _held_smtp_slots(self):
+        """Cupos SMTP que tiene el hilo actual, por clave de pool"""
+        held = getattr(self._smtp_held, 'counts', None)
+        if held is None:
+            held = self._smtp_held.counts = {}
+        return held
+
+    def _acquire_smtp_slot(self, key):
+        """Espera un cupo de conexión SMTP para la cuenta (ver SMTP_MAX_SESSIONS)"""
+        held = self._held_smtp_slots()
+        if held.get(key, 0) == 0:
+            with self._smtp_pool_lock:
+                slot = self._smtp_slots.get(key)
+                if slot is None:
+                    slot = self._smtp_slots[key] = threading.BoundedSemaphore(self.SMTP_MAX_SESSIONS)
+            slot.acquire()
+        held[key] = held.get(key, 0) + 1
+
+    def _release_smtp_slot(self, key):
+        """Libera el cupo tomado por _acquire_smtp_slot al devolver o cerrar la conexión"""
+        held = self._held_smtp_slots()
+        held[key] -= 1
+        if held[key] == 0:
+            self._smtp_slots[key].release()
+
+    def _checkout_smtp(self, key, server, port, email_addr, password, logger):
+        """
+        Toma una conexión libre del pool o abre una nueva
+
+        Las conexiones del pool se verifican con NOOP antes de usarlas; las que el
+        servidor ya cerró por inactividad se descartan. Si la cuenta ya tiene
+        SMTP_MAX_SESSIONS conexiones en uso, espera a que se libere una. La conexión
+        se devuelve con _checkin_smtp o se cierra con _discard_smtp.
+        """
+        self._acquire_smtp_slot(key)
+        try:
+            while True:
+                with self._smtp_pool_lock:
+                    idle = self._smtp_pool.get(key)
+                    smtp = idle.pop() if idle else None
+
+                if smtp is None:
+                    return self._connect_smtp(server, port, email_addr, password, logger)
+
+                try:
+                    if smtp.noop()[0] == 250:
+                        logger.info("♻️ Reutilizando conexión SMTP existente")
+                        return smtp
+                except (smtplib.SMTPException, OSError):
+                    pass
+                _close_smtp(smtp)
+        except BaseException:
+            self._release_smtp_slot(key)
+            raise
+
+    def _checkin_smtp(self, key, smtp):
+        """Devuelve una conexión sana al pool para el siguiente envío"""
+        try:
+            if smtp.sock is None:
+                # Cerrada tras un error (ver _PipelinedSMTP._reset_transaction)
+                return
+            with self._smtp_pool_lock:
+                self._smtp_pool.setdefault(key, []).append(smtp)
+        finally:
+            self._release_smtp_slot(key)
+
+    def _discard_smtp(self, key, smtp):
+        """Cierra una conexión tomada con _checkout_smtp en lugar de devolverla al pool"""
+        _close_smtp(smtp)
+        self._release_smtp_slot(key)
+
+    @contextmanager
+    def _open_smtp(self, provider, email_addr, password, logger):
+        """
+        Conexión SMTP autenticada para varios envíos seguidos
+
+        Se toma del pool al entrar y se devuelve al salir; si el bloque termina con
+        error la conexión se cierra en lugar de volver al pool.
+        """
+        server, port = self._smtp_endpoint(provider)
+        email_addr = _sanitize_string(email_addr)
+        password = _sanitize_string(password)
+
+        # El servidor forma parte de la clave: al activar o desactivar el MTA local no se
+        # reutiliza una conexión abierta con el otro servidor
+        pool_key = _pool_key(server, port, email_addr, password=password)
+        smtp = self._checkout_smtp(pool_key, server, port, email_addr, password, logger)
+        try:
+            yield smtp
+        except BaseException:
+            self._discard_smtp(pool_key, smtp)
+            raise
+        self._checkin_smtp(pool_key, smtp)
+
+    def _checkout_imap(self, key, server, port, email_addr, password, logger):
+        """
+        Toma la sesión IMAP de la cuenta o abre una nueva (TLS + LOGIN)
+
+        La sesión guardada se verifica con NOOP; si el servidor la cerró se descarta
+        y se abre otra.
+        """
+        with self._imap_pool_lock:
+            imap = self._imap_pool.pop(key, None)
+
+        if imap is not None:
+            try:
+                if imap.noop()[0] == 'OK':
+                    logger.info("♻️ Reutilizando sesión IMAP existente")
+                    return imap
+            except (imaplib.IMAP4.error, OSError):
+                pass
+            _logout_imap(imap)
+
+        logger.info("📧 Conectando al servidor IMAP: %s:%s", server, port)
+        imap = imaplib.IMAP4_SSL(server, port, ssl_context=ssl.create_default_context())
+        try:
+            logger.info("🔐 Autenticando cuenta: %s", email_addr)
+            imap.login(email_addr, password)
+        except Exception:
+            _logout_imap(imap)
+            raise
+        logger.info("✅ Conexión IMAP establecida correctamente")
+        return imap
+
+    def _checkin_imap(self, key, imap):
+        """
+        Deselecciona la bandeja y guarda la sesión para la siguiente revisión
+
+        No se usa CLOSE: además de deseleccionar, borra definitivamente los correos marcados
+        \\Deleted. Si el servidor no soporta UNSELECT (RFC 3691) la bandeja queda
+        seleccionada; cada uso de la sesión vuelve a hacer SELECT de INBOX.
+        """
+        try:
+            if imap.state == 'SELECTED' and 'UNSELECT' in imap.capabilities:
+                imap.unselect()
+        except (imaplib.IMAP4.error, OSError):
+            _logout_imap(imap)
+            return
+
+        with self._imap_pool_lock:
+            previous = self._imap_pool.pop(key, None)
+            self._imap_pool[key] = imap
+
+        if previous is not None:
+            _logout_imap(previous)
+
+    def close_all(self):
+        """Cierra todas las conexiones SMTP e IMAP de los pools (llamar al cerrar la aplicación)"""
+        with self._smtp_pool_lock:
+            pool, self._smtp_pool = self._smtp_pool, {}
+
+        for connections in pool.values():
+            for smtp in connections:
+                _close_smtp(smtp)
+
+        with self._imap_pool_lock:
+            imap_pool, self._imap_pool = self._imap_pool, {}
+
+        for imap in imap_pool.values():
+            _logout_imap(imap)
+
+    def test_smtp_connection(self, provider, email_addr, password, logger=None, local_relay=None):
         """Prueba la conexión SMTP con los parámetros proporcionados"""
         try:
-            config = self.get_provider_config(provider)
-            server = config['smtp_server']
-            port = config['smtp_port']
+            server, port = self._smtp_endpoint(provider, local_relay)
 
             email_addr = _sanitize_string(email_addr)
             password = _sanitize_string(password)
 
-            context = ssl.create_default_context()
-
             smtp = smtplib.SMTP(server, port)
             smtp.ehlo()
-            smtp.starttls(context=context)
-            smtp.ehlo()
-            smtp.login(email_addr, password)
+
+            # Un MTA local en loopback no requiere TLS ni autenticación
+            if not _is_loopback_host(server):
+                context = ssl.create_default_context()
+                smtp.starttls(context=context)
+                smtp.ehlo()
+                smtp.login(email_addr, password)
+
             smtp.quit()
 
             return True
 
         except Exception as e:
-            print(f"Error en la conexión SMTP: {str(e)}")
+            (logger or _log).error("Error en la conexión SMTP: %s", e, exc_info=True)
             return False
 
-    def test_imap_connection(self, provider, email_addr, password):
+    def test_imap_connection(self, provider, email_addr, password, logger=None):
         """Prueba la conexión IMAP con los parámetros proporcionados"""
         try:
             config = self.get_provider_config(provider)
@@ -725,74 +1602,193 @@ class EmailManager:
             return True
 
         except Exception as e:
-            print(f"Error en la conexión IMAP: {str(e)}")
+            (logger or _log).error("Error en la conexión IMAP: %s", e, exc_info=True)
             return False
 
     def send_email(self, provider, email_addr, password, to, subject, body, cc_list=None, attachments=None,
-                   logger=None):
-        """Envía un correo electrónico a través de SMTP"""
-        try:
-            # Si no se proporciona logger, usar print como fallback
-            if not logger:
-                logger = type('obj', (object,), {
-                    'info': lambda msg: print(msg),
-                    'warning': lambda msg: print(f"WARNING: {msg}"),
-                    'error': lambda msg: print(f"ERROR: {msg}")
-                })()
-
-            config = self.get_provider_config(provider)
-            server = config['smtp_server']
-            port = config['smtp_port']
-
-            email_addr = _sanitize_string(email_addr)
-            password = _sanitize_string(password)
+                   logger=None, smtp=None):
+        """
+        Envía un correo electrónico a través de SMTP
 
-            logger.info(f"📤 Preparando correo para enviar...")
-            logger.info(f"   Destinatario: {to}")
-            logger.info(f"   Asunto: {subject}")
+        Si se pasa smtp (conexión abierta con _open_smtp) se envía por ella, sin
+        conectar ni autenticar de nuevo.
+        """
+        # Si no se proporciona logger, usar el logger del módulo
+        logger = logger or _log
 
-            msg = MIMEMultipart()
-            msg['From'] = email_addr
-            msg['To'] = to
-            msg['Subject'] = subject
+        try:
+            logger.info("📤 Preparando correo para enviar...")
+            logger.info("   Destinatario: %s", to)
+            logger.info("   Asunto: %s", subject)
 
             if cc_list:
-                logger.info(f"   CC: {', '.join(cc_list)}")
-                msg['Cc'] = ", ".join(cc_list)
-
-            msg.attach(MIMEText(body, 'plain', 'utf-8'))
+                logger.info("   CC: %s", ', '.join(cc_list))
 
             if attachments:
-                logger.info(f"📎 Adjuntando {len(attachments)} archivo(s)...")
+                logger.info("📎 Adjuntando %d archivo(s)...", len(attachments))
                 for attachment in attachments:
-                    _attach_file(msg, attachment)
-                    filename = attachment.get('filename', 'archivo_sin_nombre')
-                    logger.info(f"   • {filename}")
+                    logger.info("   • %s", attachment.get('filename', 'archivo_sin_nombre'))
 
-            context = ssl.create_default_context()
+            msg = _build_message(email_addr, to, subject, body, cc_list, attachments, logger)
+            recipients = [to] + list(cc_list or [])
+            self._deliver(provider, email_addr, password, recipients, _flatten_message(msg), logger, smtp)
+            return True
 
-            logger.info(f"📧 Conectando al servidor SMTP: {server}:{port}")
+        except Exception as e:
+            logger.error("❌ Error al enviar correo: %s", e)
+            return False
 
-            with smtplib.SMTP(server, port) as smtp:
-                smtp.ehlo()
-                logger.info("🔐 Estableciendo conexión segura (TLS)...")
-                smtp.starttls(context=context)
-                smtp.ehlo()
-                logger.info(f"🔐 Autenticando cuenta: {email_addr}")
-                smtp.login(email_addr, password)
-                logger.info("📨 Enviando correo...")
-                smtp.send_message(msg)
+    def _send_prebuilt(self, provider, email_addr, password, to, template_bytes, logger, smtp=None):
+        """
+        Envía a un destinatario un mensaje ya serializado sin encabezado To
 
-            logger.info("✅ Correo enviado exitosamente")
+        template_bytes sale de _flatten_message(_build_message(..., to=None, ...)): el
+        mensaje con sus adjuntos se serializa una sola vez y por destinatario solo se
+        antepone el To.
+        """
+        try:
+            self._deliver(provider, email_addr, password, [to], _to_header_bytes(to) + template_bytes, logger,
+                          smtp)
             return True
-
         except Exception as e:
-            if logger:
-                logger.error(f"❌ Error al enviar correo: {str(e)}")
-            else:
-                print(f"Error al enviar correo: {str(e)}")
+            logger.error("❌ Error al enviar correo: %s", e)
             return False
 
+    def _send_prebuilt_many(self, provider, email_addr, password, recipients, template_bytes, logger, smtp=None):
+        """
+        Envía la misma plantilla a varios destinatarios en paralelo
+
+        Los destinatarios se reparten entre hasta MAX_CC_SEND_WORKERS hilos y cada hilo
+        envía su parte por una sola conexión: el primero usa la compartida smtp (si se
+        pasó) y los demás toman la suya del pool. smtplib no es thread-safe, por eso
+        ninguna conexión se usa desde dos hilos.
+
+        Retorna:
+            lista de (destinatario, bool) en el mismo orden de recipients
+        """
+        if not recipients:
+            return []
+
+        def send_chunk(chunk, shared):
+            if shared is not None:
+                return [(to, self._send_prebuilt(provider, email_addr, password, to, template_bytes, logger,
+                                                 smtp=shared)) for to in chunk]
+            try:
+                with self._open_smtp(provider, email_addr, password, logger) as own:
+                    return [(to, self._send_prebuilt(provider, email_addr, password, to, template_bytes, logger,
+                                                     smtp=own)) for to in chunk]
+            except Exception as e:
+                logger.error("❌ No se pudo abrir la conexión SMTP: %s", e)
+                return [(to, False) for to in chunk]
+
+        workers = min(self.MAX_CC_SEND_WORKERS, len(recipients))
+        if workers == 1:
+            return send_chunk(recipients, smtp)
+
+        chunks = [recipients[i::workers] for i in range(workers)]
+        sent = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(send_chunk, chunk, smtp if i == 0 else None)
+                       for i, chunk in enumerate(chunks)]
+            for future in as_completed(futures):
+                sent.update(future.result())
+
+        return [(to, sent[to]) for to in recipients]
+
+    def _deliver(self, provider, email_addr, password, recipients, message_bytes, logger, smtp=None):
+        """
+        Entrega un mensaje serializado por SMTP; lanza excepción si no se pudo enviar
+
+        Si se pasa smtp (conexión abierta con _open_smtp) se envía por ella, sin
+        conectar ni autenticar de nuevo; si esa conexión se cayó se usa el pool.
+        Las respuestas temporales (421/450/454) anteriores a la aceptación de DATA se
+        reintentan hasta SMTP_MAX_RETRIES veces, y solo para los destinatarios que no
+        recibieron el mensaje. Un error ya enviado el cuerpo no se reintenta (el servidor
+        pudo haberlo encolado).
+        """
+        server, port = self._smtp_endpoint(provider)
+
+        email_addr = _sanitize_string(email_addr)
+        password = _sanitize_string(password)
+        pool_key = _pool_key(server, port, email_addr, password=password)
+
+        # Códigos 4xx temporales (p. ej. 421 "demasiadas conexiones"): se reintenta con espera
+        # exponencial en lugar de dar el correo por perdido
+        pending = list(recipients)
+        for attempt in range(self.SMTP_MAX_RETRIES + 1):
+            try:
+                refused = self._deliver_once(pool_key, server, port, email_addr, password, pending,
+                                             message_bytes, logger, smtp)
+            except _SMTPBodySentError:
+                raise
+            except smtplib.SMTPRecipientsRefused as e:
+                # Ningún destinatario aceptado: el mensaje no se envió a nadie
+                if attempt == self.SMTP_MAX_RETRIES or not _is_transient_smtp_error(e):
+                    raise
+                refused = e.recipients
+            except smtplib.SMTPResponseException as e:
+                # MAIL FROM o DATA rechazados: el mensaje no se envió a nadie
+                if attempt == self.SMTP_MAX_RETRIES or not _is_transient_smtp_error(e):
+                    raise
+                refused = {addr: (e.smtp_code, e.smtp_error) for addr in pending}
+
+            pending = [addr for addr, (code, _) in refused.items() if code in _SMTP_TRANSIENT_CODES]
+            for addr, (code, resp) in refused.items():
+                if code not in _SMTP_TRANSIENT_CODES:
+                    logger.warning("⚠️ Destinatario rechazado por el servidor: %s (%s %s)", addr, code, resp)
+            if not pending:
+                return
+            if attempt == self.SMTP_MAX_RETRIES:
+                raise smtplib.SMTPRecipientsRefused({addr: refused[addr] for addr in pending})
+
+            delay = self.SMTP_BACKOFF_BASE * 2 ** attempt + random.uniform(0, 0.25)
+            logger.warning("⚠️ Error temporal del servidor SMTP para %s, reintentando en %.1f s...",
+                           ', '.join(pending), delay)
+            time.sleep(delay)
+            # El reintento va por una conexión del pool: la compartida pudo quedar cerrada
+            smtp = None
+
+    def _deliver_once(self, pool_key, server, port, email_addr, password, recipients, message_bytes, logger,
+                      smtp=None):
+        """
+        Un intento de entrega de _deliver (por smtp o por una conexión del pool)
+
+        Retorna el dict de destinatarios rechazados de sendmail ({} si todos lo recibieron)
+        """
+        if smtp is not None:
+            try:
+                logger.info("📨 Enviando correo...")
+                refused = smtp.sendmail(email_addr, recipients, message_bytes)
+                logger.info("✅ Correo enviado exitosamente")
+                return refused
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                # La conexión compartida se cayó: se cierra (su dueño no la devolverá al
+                # pool) y este envío sigue por una conexión del pool
+                _close_smtp(smtp)
+                logger.warning("⚠️ Conexión SMTP compartida cerrada por el servidor (%s), reintentando...", e)
+
+        # Si una conexión reutilizada se cae a mitad del envío, se reintenta una vez con una nueva
+        for attempt in (1, 2):
+            smtp = self._checkout_smtp(pool_key, server, port, email_addr, password, logger)
+            try:
+                logger.info("📨 Enviando correo...")
+                refused = smtp.sendmail(email_addr, recipients, message_bytes)
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                self._discard_smtp(pool_key, smtp)
+                if attempt == 2:
+                    raise
+                logger.warning("⚠️ Conexión SMTP cerrada por el servidor (%s), reintentando...", e)
+                continue
+            except Exception:
+                self._discard_smtp(pool_key, smtp)
+                raise
+
+            self._checkin_smtp(pool_key, smtp)
+            break
+
+        logger.info("✅ Correo enviado exitosamente")
+        return refused
+
     def check_and_process_emails(self, provider, email_addr, password, search_titles, logger, cc_list=None,
                                  allowed_domains=None):
         """
@@ -815,124 +1811,288 @@ class EmailManager:
             email_addr = _sanitize_string(email_addr)
             password = _sanitize_string(password)
 
-            context = ssl.create_default_context()
-
-            logger.info(f"📧 Conectando al servidor IMAP: {server}:{port}")
-
-            with imaplib.IMAP4_SSL(server, port, ssl_context=context) as imap:
-                logger.info(f"🔐 Autenticando cuenta: {email_addr}")
-                imap.login(email_addr, password)
-                logger.info("✅ Conexión IMAP establecida correctamente")
+            pool_key = _pool_key(provider, email_addr, password=password)
+            imap = self._checkout_imap(pool_key, server, port, email_addr, password, logger)
+            broken = False
 
+            try:
                 logger.info("📬 Seleccionando bandeja INBOX")
                 imap.select('INBOX')
                 logger.info("✅ Bandeja INBOX seleccionada")
 
-                today = date.today()
-                yesterday = (today - timedelta(days=1)).strftime("%d-%b-%Y")
+                yesterday = _imap_since_date(date.today())
 
                 search_criteria = ['(UNSEEN)', f'(SINCE "{yesterday}")']
 
                 if search_titles:
                     subject_queries = [f'(SUBJECT "{title.strip()}")' for title in search_titles if title.strip()]
 
-                    if len(subject_queries) > 1:
-                        search_criteria.append(f'(OR {" ".join(subject_queries)})')
-                    elif subject_queries:
-                        search_criteria.append(subject_queries[0])
+                    if subject_queries:
+                        search_criteria.append(_imap_or(subject_queries))
 
                 final_query = ' '.join(search_criteria)
-                logger.info(f"Ejecutando búsqueda IMAP: {final_query}")
-
-                try:
-                    status, messages = imap.search('UTF-8', final_query)
-                except:
-                    logger.warning("Reintentando búsqueda sin UTF-8...")
-                    status, messages = imap.search(None, final_query)
+                logger.info("Ejecutando búsqueda IMAP: %s", final_query)
+
+                # Con títulos ASCII no hace falta CHARSET: el servidor no convierte nada y
+                # cada criterio va como argumento propio
+                # Se trabaja con UIDs (UID SEARCH/FETCH/STORE): a diferencia de los números de
+                # secuencia, no cambian si otro cliente elimina correos durante el ciclo
+                needs_utf8 = not final_query.isascii()
+                if not needs_utf8:
+                    status, messages = imap.uid('SEARCH', *search_criteria)
+                else:
+                    try:
+                        # imaplib codifica los str en ASCII: la consulta se envía ya en UTF-8
+                        status, messages = imap.uid('SEARCH', 'CHARSET', 'UTF-8', final_query.encode('utf-8'))
+                    except imaplib.IMAP4.abort:
+                        # Conexión perdida: no tiene sentido reintentar por el mismo socket; el
+                        # finally descarta la sesión en lugar de devolverla al pool
+                        raise
+                    except imaplib.IMAP4.error as e:
+                        # BAD: imaplib lo convierte en excepción
+                        status, messages = 'BAD', [e]
+
+                    # Servidor sin soporte UTF-8 en SEARCH: la negativa habitual es NO [BADCHARSET],
+                    # que llega como estado y no como excepción. Se buscan solo los no leídos
+                    # recientes y el asunto se filtra localmente en _match_case
+                    if status != 'OK':
+                        logger.warning("Búsqueda UTF-8 rechazada (%s), buscando sin filtro de asunto...",
+                                       messages[0] if messages else status)
+                        status, messages = imap.uid('SEARCH', *search_criteria[:2])
+
+                if status != 'OK' or not messages:
+                    logger.error("❌ La búsqueda IMAP falló: %s %s", status, messages)
+                    return
 
-                message_ids = messages[0].split()
+                message_ids = (messages[0] or b'').split()
+                # imaplib siempre entrega los UIDs como bytes: se decodifican una sola vez
+                msg_id_strs = [m.decode('ascii') for m in message_ids]
 
                 if not message_ids:
                     logger.info("No se encontraron correos nuevos que coincidan.")
                     return
 
-                logger.info(f"Encontrados {len(message_ids)} emails que coinciden")
+                logger.info("Encontrados %d emails que coinciden", len(message_ids))
+
+                # Palabras clave y dominios permitidos normalizados una sola vez para todo el lote
+                case_matcher = self.case_handler.prepare_matcher(allowed_domains)
+
+                # Primero solo Asunto y Remitente (PEEK no marca \\Seen): los correos que no
+                # coinciden con ningún caso no se descargan completos y quedan sin leer
+                logger.info("📥 Descargando encabezados de los correos encontrados...")
+                matching_cases = {}
+                for msg_id_str, raw_headers in self._fetch_in_batches(
+                        imap, msg_id_strs, '(UID BODY.PEEK[HEADER.FIELDS (SUBJECT FROM)])', logger):
+                    headers = _HEADER_PARSER.parsebytes(raw_headers)
+                    subject = headers.get('Subject', '')
+                    sender = headers.get('From', '')
+                    matching_case = self._match_case(subject, sender, allowed_domains, case_matcher, logger)
+                    if matching_case:
+                        matching_cases[msg_id_str] = matching_case
+                    else:
+                        logger.info("Email no coincide con ningún caso: '%s'", subject)
+
+                if not matching_cases:
+                    logger.info("Ningún correo coincide con los casos configurados.")
+                    return
+
+                logger.info("📥 Descargando %d correo(s) que coinciden con algún caso...", len(matching_cases))
+                processed_ids = []
+
+                # imaplib no es thread-safe: las descargas se hacen en este hilo y solo el
+                # procesamiento se reparte entre los workers (el caso en sí, de a uno)
+                with ThreadPoolExecutor(max_workers=self.MAX_PROCESSING_WORKERS) as executor:
+                    futures = {}
 
-                for msg_id in message_ids:
                     try:
-                        logger.info(
-                            f"📨 Procesando email ID: {msg_id.decode() if isinstance(msg_id, bytes) else msg_id}")
+                        # BODY.PEEK[] no marca \\Seen: si el procesamiento falla el correo queda sin leer
+                        for msg_id_str, raw_email in self._fetch_in_batches(imap, list(matching_cases),
+                                                                             '(UID BODY.PEEK[])', logger):
+                            logger.info("📨 Procesando email ID: %s", msg_id_str)
+                            future = executor.submit(self._process_one_email, provider, email_addr, password,
+                                                     msg_id_str, raw_email, logger, cc_list, allowed_domains,
+                                                     case_matcher, matching_cases.get(msg_id_str))
+                            futures[future] = msg_id_str
+                    finally:
+                        # Aunque la descarga falle a mitad de camino, los correos ya enviados a
+                        # procesar se esperan y los que se respondieron se marcan como leídos:
+                        # si no, se volverían a responder en la siguiente revisión
+                        # Resultados en el orden en que terminan: un error se registra en cuanto ocurre
+                        for future in as_completed(futures):
+                            msg_id_str = futures[future]
+                            try:
+                                if future.result():
+                                    processed_ids.append(msg_id_str)
+                            except Exception as e:
+                                logger.exception("Error al procesar email individual %s: %s", msg_id_str, e)
+
+                        # Un solo STORE para todos los correos procesados en lugar de uno por correo
+                        _mark_batch_as_read(imap, processed_ids, logger)
+
+            except Exception:
+                broken = True
+                raise
+            finally:
+                if broken:
+                    _logout_imap(imap)
+                else:
+                    self._checkin_imap(pool_key, imap)
+
+        except Exception as e:
+            logger.exception("Error en check_and_process_emails: %s", e)
+
+    def _fetch_in_batches(self, imap, msg_ids, fetch_items, logger):
+        """
+        Ejecuta UID FETCH por lotes de FETCH_BATCH_SIZE UIDs y produce (uid, contenido)
+
+        Cada lote es un solo comando con el conjunto de IDs separado por comas; si el
+        servidor rechaza un lote se registra y se continúa con el siguiente.
+        """
+        ids = iter(msg_ids)
+        while True:
+            batch = list(islice(ids, self.FETCH_BATCH_SIZE))
+            if not batch:
+                return
+
+            status, fetch_data = imap.uid('FETCH', ','.join(batch), fetch_items)
+            if status != 'OK' or not fetch_data:
+                logger.warning("⚠️ No se pudieron obtener los correos %s..%s", batch[0], batch[-1])
+                continue
+
+            yield from _iter_fetch_payloads(fetch_data)
+
+    def idle_and_wait(self, provider, email_addr, password, logger, timeout=300):
+        """
+        Espera con IMAP IDLE (RFC 2177) a que llegue correo nuevo a INBOX
+
+        Usa la sesión del pool, así que no hay LOGIN por cada espera. Retorna True si el
+        servidor avisó de correos nuevos (EXISTS) y False si venció el timeout. Si el
+        servidor no soporta IDLE o la sesión falla, espera el timeout y retorna True
+        para que el llamador haga la revisión normal.
+        """
+        try:
+            config = self.get_provider_config(provider)
+            email_addr = _sanitize_string(email_addr)
+            password = _sanitize_string(password)
+            pool_key = _pool_key(provider, email_addr, password=password)
+            imap = self._checkout_imap(pool_key, config['imap_server'], config['imap_port'],
+                                       email_addr, password, logger)
+        except Exception as e:
+            logger.warning("⚠️ No se pudo abrir la sesión IMAP para IDLE: %s", e)
+            time.sleep(timeout)
+            return True
 
-                        logger.info("📥 Descargando contenido del correo desde el servidor...")
-                        status, email_data = imap.fetch(msg_id, '(RFC822)')
+        if 'IDLE' not in imap.capabilities:
+            self._checkin_imap(pool_key, imap)
+            time.sleep(timeout)
+            return True
 
-                        if status != 'OK' or not email_data:
-                            logger.warning(f"⚠️ No se pudo obtener el email {msg_id}")
-                            continue
+        try:
+            imap.select('INBOX')
+            new_mail = _imap_idle(imap, timeout)
+        except (imaplib.IMAP4.error, OSError) as e:
+            logger.warning("⚠️ IDLE interrumpido (%s), se revisará el buzón", e)
+            _logout_imap(imap)
+            return True
 
-                        logger.info("✅ Correo descargado correctamente")
+        self._checkin_imap(pool_key, imap)
+        if new_mail:
+            logger.info("📨 El servidor avisó de correos nuevos")
+        return new_mail
 
-                        logger.info("📖 Leyendo y decodificando el correo...")
-                        raw_email = email_data[0][1]
-                        email_message = email.message_from_bytes(raw_email, policy=email.policy.default)
+    def _match_case(self, subject, sender, allowed_domains, case_matcher, logger):
+        """
+        Devuelve el caso que coincide con el asunto/remitente o None
 
-                        subject = _decode_header_value(email_message.get('Subject', ''))
-                        sender = email_message.get('From', '')
+        case_matcher es el CaseMatcher de CaseHandler.prepare_matcher(), preparado una
+        vez por lote; si no se indica se prepara aquí a partir de allowed_domains.
+        """
+        if case_matcher is None:
+            case_matcher = self.case_handler.prepare_matcher(allowed_domains)
 
-                        logger.info(f"📧 Email leído: Asunto='{subject}' | Remitente={sender}")
+        matching_case, motivo = case_matcher.match(subject, sender)
+        if matching_case:
+            logger.info("✓ Caso encontrado por %s: %s", motivo, matching_case)
+        return matching_case
 
-                        # Extraer cuerpo del correo
-                        body_text = _extract_body_text(email_message)
+    def _process_one_email(self, provider, email_addr, password, msg_id, raw_email, logger, cc_list=None,
+                           allowed_domains=None, case_matcher=None, matching_case=None):
+        """
+        Procesa un correo ya descargado: lo decodifica, busca el caso que coincide,
+        lo ejecuta y envía la respuesta automática.
 
-                        # Detectar si viene garantía en el correo
-                        garantia_correo = _detectar_garantia_en_correo(body_text, logger)
+        Se ejecuta dentro de un worker del ThreadPoolExecutor de check_and_process_emails,
+        por lo que no debe usar la conexión IMAP (imaplib no es thread-safe). La ejecución
+        del caso se serializa con _case_lock; el resto (MIME, SMTP) corre en paralelo.
 
-                        # Detectar si viene proveedor (distribuidor) en el correo
-                        proveedor_correo = _detectar_proveedor_en_correo(body_text, logger)
+        matching_case es el caso ya resuelto a partir de los encabezados; si no se
+        indica se busca aquí con _match_case.
 
-                        # Detectar si viene código de sucursal con palabra clave 'servitotal' en el correo
-                        servitotal_correo = _detectar_servitotal_en_correo(body_text, logger)
+        Returns:
+            bool: True si el caso generó una respuesta y el correo debe marcarse como leído
+        """
+        if not matching_case:
+            # Solo los encabezados: si no coincide con ningún caso no se analiza el resto del MIME
+            headers = _HEADER_PARSER.parsebytes(raw_email)
+            subject = headers.get('Subject', '')
+            matching_case = self._match_case(subject, headers.get('From', ''), allowed_domains, case_matcher,
+                                             logger)
+            if not matching_case:
+                logger.info("Email no coincide con ningún caso: '%s'", subject)
+                return False
 
-                        attachments = _extract_attachments(email_message, logger)
+        logger.info("📖 Leyendo y decodificando el correo...")
+        email_message = _parse_message_bytes(raw_email)
 
-                        # Pasar sender y allowed_domains a find_matching_case
-                        matching_case = self.case_handler.find_matching_case(subject, sender, allowed_domains, logger)
+        # Con policy.default el asunto ya viene decodificado (RFC 2047), no hace falta decode_header
+        subject = email_message.get('Subject', '')
+        sender = email_message.get('From', '')
 
-                        if matching_case:
-                            logger.info(f"Email encontrado para caso: {matching_case}")
+        logger.info("📧 Email leído: Asunto='%s' | Remitente=%s", subject, sender)
 
-                            email_data_for_case = {
-                                'sender': sender,
-                                'subject': subject,
-                                'msg_id': msg_id.decode() if isinstance(msg_id, bytes) else str(msg_id),
-                                'attachments': attachments,
-                                'body_text': body_text,
-                                'garantia_correo': garantia_correo,
-                                'proveedor_correo': proveedor_correo,  # proveedor = distribuidor
-                                'servitotal_correo': servitotal_correo  # código de sucursal del correo
-                            }
+        logger.info("Email encontrado para caso: %s", matching_case)
 
-                            response_data = self.case_handler.execute_case(matching_case, email_data_for_case, logger)
+        # Cuerpo y adjuntos en una sola pasada; los adjuntos van a archivos temporales
+        # que se eliminan al terminar con el correo
+        body_text, detection_text, attachments = _parse_email(email_message, logger)
+        try:
+            # Detectar garantía, proveedor (distribuidor) y código de sucursal 'servitotal' en el correo
+            deteccion = _analyze_body(detection_text, logger)
+
+            return self._run_case_and_reply(provider, email_addr, password, matching_case, sender, subject,
+                                            msg_id, attachments, body_text, deteccion, logger, cc_list)
+        finally:
+            _cleanup_attachment_files(attachments)
+
+    def _run_case_and_reply(self, provider, email_addr, password, matching_case, sender, subject, msg_id,
+                            attachments, body_text, deteccion, logger, cc_list=None):
+        """Ejecuta el caso con los datos del correo y envía la respuesta automática"""
+        email_data_for_case = {
+            'sender': sender,
+            'subject': subject,
+            'msg_id': msg_id,
+            'attachments': attachments,
+            'body_text': body_text,
+            'garantia_correo': deteccion['garantia'],
+            'proveedor_correo': deteccion['proveedor'],  # proveedor = distribuidor
+            'servitotal_correo': deteccion['servitotal']  # código de sucursal del correo
+        }
 
-                            if response_data:
-                                _mark_as_read(imap, msg_id, logger)
+        with self._case_lock:
+            response_data = self.case_handler.execute_case(matching_case, email_data_for_case, logger)
 
-                                response_attachments = response_data.get('attachments', [])
-                                if self._send_case_reply(provider, email_addr, password, response_data, logger,
-                                                         cc_list, response_attachments):
-                                    logger.info(f"Respuesta automática enviada usando {matching_case}")
-                                else:
-                                    logger.error("Error al enviar respuesta automática")
-                            else:
-                                logger.error(f"Error al procesar {matching_case}")
-                        else:
-                            logger.info(f"Email no coincide con ningún caso: '{subject}'")
+        if not response_data:
+            logger.error("Error al procesar %s", matching_case)
+            return False
 
-                    except Exception as e:
-                        logger.exception(f"Error al procesar email individual {msg_id}: {str(e)}")
+        response_attachments = response_data.get('attachments', [])
+        if self._send_case_reply(provider, email_addr, password, response_data, logger,
+                                 cc_list, response_attachments):
+            logger.info("Respuesta automática enviada usando %s", matching_case)
+        else:
+            logger.error("Error al enviar respuesta automática")
 
-        except Exception as e:
-            logger.exception(f"Error en check_and_process_emails: {str(e)}")
+        return True
 
     def _send_case_reply(self, provider, email_addr, password, response_data, logger, cc_list=None, attachments=None):
         """Envía una respuesta automática usando los datos del caso"""
@@ -949,109 +2109,70 @@ class EmailManager:
             if '<' in recipient and '>' in recipient:
                 recipient = recipient.split('<')[1].split('>')[0].strip()
 
-            logger.info(f"   Destinatario: {recipient}")
-            logger.info(f"   Asunto: {subject}")
+            logger.info("   Destinatario: %s", recipient)
+            logger.info("   Asunto: %s", subject)
 
             temp_files_to_clean = []
             if attachments:
-                logger.info(f"   Adjuntos: {len(attachments)} archivo(s)")
+                logger.info("   Adjuntos: %d archivo(s)", len(attachments))
                 for attachment in attachments:
                     if 'path' in attachment:
                         temp_files_to_clean.append(attachment['path'])
 
-            # CAMBIO: Enviar correo principal SIN CC
-            logger.info("📤 Enviando correo principal al remitente (sin CC)...")
-            result = self.send_email(provider, email_addr, password, recipient, subject, body, None, attachments,
-                                     logger)
+            # Una sola conexión SMTP para el correo principal y todas las notificaciones CC
+            with self._open_smtp(provider, email_addr, password, logger) as smtp:
+                # CAMBIO: Enviar correo principal SIN CC
+                logger.info("📤 Enviando correo principal al remitente (sin CC)...")
+                result = self.send_email(provider, email_addr, password, recipient, subject, body, None, attachments,
+                                         logger, smtp=smtp)
 
-            if not result:
-                logger.error("❌ Fallo al enviar correo principal")
-                return False
+                if not result:
+                    logger.error("❌ Fallo al enviar correo principal")
+                    return False
 
-            logger.info("✅ Correo principal enviado correctamente")
+                logger.info("✅ Correo principal enviado correctamente")
 
-            # Verificar si el correo es de error (no tiene extracted_data)
-            is_error = not extracted_data
+                # Verificar si el correo es de error (no tiene extracted_data)
+                is_error = not extracted_data
 
-            # NUEVO: Enviar correos separados a usuarios CC con archivo de texto adjunto
-            if cc_list and len(cc_list) > 0 and extracted_data:
-                logger.info("")
-                logger.info("=" * 80)
-                logger.info(f"📧 Enviando correos separados a {len(cc_list)} usuario(s) CC...")
-                logger.info("=" * 80)
-
-                # Generar el archivo de texto con los datos extraídos
-                logger.info("📝 Generando archivo de texto con datos extraídos del PDF...")
-                text_content = _generate_formatted_text_for_cc(extracted_data)
-
-                # Crear archivo temporal
-                temp_text_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8')
-                temp_text_file.write(text_content)
-                temp_text_file.close()
-                temp_files_to_clean.append(temp_text_file.name)
-
-                # Determinar nombre del archivo basado en boleta
-                boleta_numero = extracted_data.get('numero_boleta', 'datos')
-                text_filename = f"Datos_Extraidos_Boleta_{boleta_numero}.txt"
-
-                logger.info(f"✅ Archivo de texto creado: {text_filename}")
-
-                # Leer el contenido del archivo para adjuntar
-                with open(temp_text_file.name, 'rb') as f:
-                    text_file_data = f.read()
-
-                # Crear lista de adjuntos (archivo de texto + PDF original)
-                cc_attachments = [{
-                    'filename': text_filename,
-                    'data': text_file_data
-                }]
-
-                # Generar archivo de texto con datos en formato consola (una sola vez)
-                logger.info("📝 Generando archivo de texto con datos en formato consola...")
-                console_data_text = _generate_console_format_data_text(preingreso_results)
-
-                # Crear archivo temporal para los datos en formato consola
-                temp_console_data_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8')
-                temp_console_data_file.write(console_data_text)
-                temp_console_data_file.close()
-                temp_files_to_clean.append(temp_console_data_file.name)
-
-                # Determinar nombre del archivo basado en boleta
-                boleta_numero = extracted_data.get('numero_boleta', 'datos')
-                console_data_filename = f"Datos_Consola_Boleta_{boleta_numero}.txt"
-                logger.info(f"✅ Archivo de datos de consola creado: {console_data_filename}")
-
-                # Leer el contenido del archivo para adjuntar
-                with open(temp_console_data_file.name, 'rb') as f:
-                    console_data_file_data = f.read()
-
-                # Agregar el archivo de datos de consola a los adjuntos (al inicio de la lista)
-                cc_attachments.insert(0, {
-                    'filename': console_data_filename,
-                    'data': console_data_file_data
-                })
-
-                # Agregar PDF original si está disponible
-                if pdf_original and pdf_original.get('data'):
-                    pdf_filename = pdf_original.get('filename', 'boleta.pdf')
-                    pdf_data = pdf_original.get('data')
-                    cc_attachments.append({
-                        'filename': pdf_filename,
-                        'data': pdf_data
-                    })
-                    logger.info(f"✅ PDF original incluido: {pdf_filename}")
+                # NUEVO: Enviar correos separados a usuarios CC con archivo de texto adjunto
+                if cc_list and len(cc_list) > 0 and extracted_data:
+                    logger.info("")
+                    logger.info(_SEP80)
+                    logger.info("📧 Enviando correos separados a %d usuario(s) CC...", len(cc_list))
+                    logger.info(_SEP80)
 
-                # Enviar a cada usuario CC por separado
-                cc_success_count = 0
-                cc_failed_count = 0
+                    # Los dos archivos de texto se generan juntos, con la misma marca de tiempo
+                    logger.info("📝 Generando archivos de texto con datos extraídos del PDF y formato consola...")
+                    text_content, console_data_text = _generate_cc_text_bundle(extracted_data, preingreso_results)
 
-                for cc_email in cc_list:
-                    cc_email = cc_email.strip()
-                    if not cc_email:
-                        continue
+                    # Determinar nombres de archivo basados en boleta
+                    boleta_numero = extracted_data.get('numero_boleta', 'datos')
+                    text_filename = f"Datos_Extraidos_Boleta_{boleta_numero}.txt"
+                    console_data_filename = f"Datos_Consola_Boleta_{boleta_numero}.txt"
+                    logger.info("✅ Archivo de texto creado: %s", text_filename)
+                    logger.info("✅ Archivo de datos de consola creado: %s", console_data_filename)
+
+                    # Crear lista de adjuntos (datos de consola + archivo de texto + PDF original). Los
+                    # archivos de texto se adjuntan directamente desde memoria, sin archivos temporales
+                    cc_attachments = [
+                        {'filename': console_data_filename, 'data': console_data_text.encode('utf-8')},
+                        {'filename': text_filename, 'data': text_content.encode('utf-8')},
+                    ]
 
-                    logger.info("")
-                    logger.info(f"📧 Enviando correo a: {cc_email}")
+                    # Agregar PDF original si está disponible
+                    if pdf_original and (pdf_original.get('data') or pdf_original.get('path')):
+                        # Se adjunta el mismo diccionario: _attach_file guarda en él la parte MIME
+                        # ya codificada y los envíos a los demás usuarios CC la reutilizan
+                        pdf_filename = pdf_original.setdefault('filename', 'boleta.pdf')
+                        cc_attachments.append(pdf_original)
+                        logger.info("✅ PDF original incluido: %s", pdf_filename)
+
+                    # Enviar a cada usuario CC por separado
+                    cc_success_count = 0
+                    cc_failed_count = 0
+
+                    # El asunto y el cuerpo no dependen del destinatario: se arman una sola vez
 
                     # Asunto específico para usuarios CC
                     cc_subject = f"Notificación: {subject}"
@@ -1169,67 +2290,64 @@ class EmailManager:
 
                     cc_body = "\n".join(cc_body_lines)
 
-                    cc_result = self.send_email(
-                        provider, email_addr, password,
-                        cc_email, cc_subject, cc_body,
-                        None,  # Sin CC
-                        cc_attachments,  # Incluye archivo de texto + PDF original
-                        logger
-                    )
-
-                    if cc_result:
-                        cc_success_count += 1
-                        logger.info(f"   ✅ Correo enviado exitosamente a {cc_email}")
-                    else:
-                        cc_failed_count += 1
-                        logger.error(f"   ❌ Error al enviar correo a {cc_email}")
+                    # Mensaje con adjuntos armado y serializado una sola vez; por destinatario
+                    # solo se antepone el encabezado To
+                    cc_template = _flatten_message(
+                        _build_message(email_addr, None, cc_subject, cc_body, attachments=cc_attachments,
+                                       logger=logger))
 
-                logger.info("")
-                logger.info("=" * 80)
-                logger.info(f"📊 Resumen de envíos a usuarios CC:")
-                logger.info(f"   ✅ Exitosos: {cc_success_count}")
-                if cc_failed_count > 0:
-                    logger.info(f"   ❌ Fallidos: {cc_failed_count}")
-                logger.info("=" * 80)
-
-            elif cc_list and len(cc_list) > 0 and is_error:
-                # Enviar notificaciones de error a usuarios CC
-                logger.info("")
-                logger.info("=" * 80)
-                logger.info(f"⚠️ Enviando notificaciones de ERROR a {len(cc_list)} usuario(s) CC...")
-                logger.info("=" * 80)
+                    cc_recipients = [cc_email.strip() for cc_email in cc_list if cc_email.strip()]
+                    for cc_email in cc_recipients:
+                        logger.info("📧 Enviando correo a: %s", cc_email)
 
-                # Crear lista de adjuntos
-                cc_attachments = []
+                    cc_results = self._send_prebuilt_many(provider, email_addr, password, cc_recipients,
+                                                          cc_template, logger, smtp=smtp)
 
-                # Si hay datos extraídos, generar archivo con datos del PDF (aunque haya fallado la creación)
-                if extracted_data:
-                    logger.info("📝 Generando archivo de texto con datos extraídos del PDF...")
-                    text_content = _generate_formatted_text_for_cc(extracted_data)
+                    logger.info("")
+                    for cc_email, cc_result in cc_results:
+                        if cc_result:
+                            cc_success_count += 1
+                            logger.info("   ✅ Correo enviado exitosamente a %s", cc_email)
+                        else:
+                            cc_failed_count += 1
+                            logger.error("   ❌ Error al enviar correo a %s", cc_email)
 
-                    # Crear archivo temporal para datos extraídos
-                    temp_text_file_datos = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8')
-                    temp_text_file_datos.write(text_content)
-                    temp_text_file_datos.close()
-                    temp_files_to_clean.append(temp_text_file_datos.name)
+                    logger.info("")
+                    logger.info(_SEP80)
+                    logger.info("📊 Resumen de envíos a usuarios CC:")
+                    logger.info("   ✅ Exitosos: %d", cc_success_count)
+                    if cc_failed_count > 0:
+                        logger.info("   ❌ Fallidos: %d", cc_failed_count)
+                    logger.info(_SEP80)
+
+                elif cc_list and len(cc_list) > 0 and is_error:
+                    # Enviar notificaciones de error a usuarios CC
+                    logger.info("")
+                    logger.info(_SEP80)
+                    logger.info("⚠️ Enviando notificaciones de ERROR a %d usuario(s) CC...", len(cc_list))
+                    logger.info(_SEP80)
 
-                    # Determinar nombre del archivo basado en boleta
-                    boleta_numero = extracted_data.get('numero_boleta', 'datos')
-                    text_filename_datos = f"Datos_Extraidos_Boleta_{boleta_numero}.txt"
-                    logger.info(f"✅ Archivo de datos extraídos creado: {text_filename_datos}")
+                    # Crear lista de adjuntos
+                    cc_attachments = []
 
-                    # Leer el contenido del archivo para adjuntar
-                    with open(temp_text_file_datos.name, 'rb') as f:
-                        text_file_data_datos = f.read()
+                    # Si hay datos extraídos, generar archivo con datos del PDF (aunque haya fallado la creación)
+                    if extracted_data:
+                        logger.info("📝 Generando archivo de texto con datos extraídos del PDF...")
+                        text_content = _generate_formatted_text_for_cc(extracted_data)
 
-                    cc_attachments.append({
-                        'filename': text_filename_datos,
-                        'data': text_file_data_datos
-                    })
+                        # Determinar nombre del archivo basado en boleta
+                        boleta_numero = extracted_data.get('numero_boleta', 'datos')
+                        text_filename_datos = f"Datos_Extraidos_Boleta_{boleta_numero}.txt"
+                        logger.info("✅ Archivo de datos extraídos creado: %s", text_filename_datos)
 
-                # Generar archivo de texto con información del error
-                logger.info("📝 Generando archivo de texto con información del error...")
-                error_text_content = f"""NOTIFICACIÓN DE ERROR - PROCESAMIENTO DE PRE-INGRESO
+                        cc_attachments.append({
+                            'filename': text_filename_datos,
+                            'data': text_content.encode('utf-8')
+                        })
+
+                    # Generar archivo de texto con información del error
+                    logger.info("📝 Generando archivo de texto con información del error...")
+                    error_text_content = f"""NOTIFICACIÓN DE ERROR - PROCESAMIENTO DE PRE-INGRESO
 {'=' * 80}
 
 Se ha detectado un error durante el procesamiento del documento PDF.
@@ -1252,46 +2370,28 @@ Este archivo fue generado automáticamente por GolloBot.
 Sistema Automatizado de Gestión de Reparaciones
 """
 
-                # Crear archivo temporal con la información del error
-                temp_text_file_error = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8')
-                temp_text_file_error.write(error_text_content)
-                temp_text_file_error.close()
-                temp_files_to_clean.append(temp_text_file_error.name)
-
-                text_filename_error = f"Error_Procesamiento_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-                logger.info(f"✅ Archivo de error creado: {text_filename_error}")
+                    text_filename_error = f"Error_Procesamiento_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+                    logger.info("✅ Archivo de error creado: %s", text_filename_error)
 
-                # Leer el contenido del archivo para adjuntar
-                with open(temp_text_file_error.name, 'rb') as f:
-                    text_file_data_error = f.read()
-
-                cc_attachments.append({
-                    'filename': text_filename_error,
-                    'data': text_file_data_error
-                })
-
-                # Agregar PDF original si está disponible
-                if pdf_original and pdf_original.get('data'):
-                    pdf_filename = pdf_original.get('filename', 'documento_error.pdf')
-                    pdf_data = pdf_original.get('data')
                     cc_attachments.append({
-                        'filename': pdf_filename,
-                        'data': pdf_data
+                        'filename': text_filename_error,
+                        'data': error_text_content.encode('utf-8')
                     })
-                    logger.info(f"✅ PDF original incluido: {pdf_filename}")
-                else:
-                    logger.warning("⚠️ PDF original no disponible para adjuntar")
 
-                cc_success_count = 0
-                cc_failed_count = 0
+                    # Agregar PDF original si está disponible
+                    if pdf_original and (pdf_original.get('data') or pdf_original.get('path')):
+                        # Se adjunta el mismo diccionario: _attach_file guarda en él la parte MIME
+                        # ya codificada y los envíos a los demás usuarios CC la reutilizan
+                        pdf_filename = pdf_original.setdefault('filename', 'documento_error.pdf')
+                        cc_attachments.append(pdf_original)
+                        logger.info("✅ PDF original incluido: %s", pdf_filename)
+                    else:
+                        logger.warning("⚠️ PDF original no disponible para adjuntar")
 
-                for cc_email in cc_list:
-                    cc_email = cc_email.strip()
-                    if not cc_email:
-                        continue
+                    cc_success_count = 0
+                    cc_failed_count = 0
 
-                    logger.info("")
-                    logger.info(f"📧 Enviando notificación de error a: {cc_email}")
+                    # El asunto y el cuerpo no dependen del destinatario: se arman una sola vez
 
                     # Asunto específico para notificación de error
                     cc_subject = f"⚠️ Notificación de Error: {subject}"
@@ -1331,45 +2431,54 @@ Sistema Automatizado de Gestión de Reparaciones
 
                     cc_body = "\n".join(cc_body_lines)
 
-                    cc_result = self.send_email(
-                        provider, email_addr, password,
-                        cc_email, cc_subject, cc_body,
-                        None,  # Sin CC
-                        cc_attachments,  # Incluye archivo de texto + PDF original
-                        logger
-                    )
-
-                    if cc_result:
-                        cc_success_count += 1
-                        logger.info(f"   ✅ Notificación de error enviada exitosamente a {cc_email}")
-                    else:
-                        cc_failed_count += 1
-                        logger.error(f"   ❌ Error al enviar notificación a {cc_email}")
+                    # Mensaje con adjuntos armado y serializado una sola vez; por destinatario
+                    # solo se antepone el encabezado To
+                    cc_template = _flatten_message(
+                        _build_message(email_addr, None, cc_subject, cc_body, attachments=cc_attachments,
+                                       logger=logger))
 
-                logger.info("")
-                logger.info("=" * 80)
-                logger.info(f"📊 Resumen de notificaciones de error:")
-                logger.info(f"   ✅ Exitosas: {cc_success_count}")
-                if cc_failed_count > 0:
-                    logger.info(f"   ❌ Fallidas: {cc_failed_count}")
-                logger.info("=" * 80)
+                    cc_recipients = [cc_email.strip() for cc_email in cc_list if cc_email.strip()]
+                    for cc_email in cc_recipients:
+                        logger.info("📧 Enviando notificación de error a: %s", cc_email)
+
+                    cc_results = self._send_prebuilt_many(provider, email_addr, password, cc_recipients,
+                                                          cc_template, logger, smtp=smtp)
+
+                    logger.info("")
+                    for cc_email, cc_result in cc_results:
+                        if cc_result:
+                            cc_success_count += 1
+                            logger.info("   ✅ Notificación de error enviada exitosamente a %s", cc_email)
+                        else:
+                            cc_failed_count += 1
+                            logger.error("   ❌ Error al enviar notificación a %s", cc_email)
+
+                    logger.info("")
+                    logger.info(_SEP80)
+                    logger.info("📊 Resumen de notificaciones de error:")
+                    logger.info("   ✅ Exitosas: %d", cc_success_count)
+                    if cc_failed_count > 0:
+                        logger.info("   ❌ Fallidas: %d", cc_failed_count)
+                    logger.info(_SEP80)
 
             # Limpiar archivos temporales
             if temp_files_to_clean:
                 logger.info("")
                 logger.info("🧹 Limpiando archivos temporales...")
                 for temp_path in temp_files_to_clean:
+                    # Un solo unlink por archivo: si ya no existe no hay nada que limpiar
                     try:
-                        if os.path.exists(temp_path):
-                            os.unlink(temp_path)
-                            logger.info(f"   • Eliminado: {os.path.basename(temp_path)}")
-                    except Exception as cleanup_error:
-                        logger.warning(f"   ⚠️ No se pudo eliminar {os.path.basename(temp_path)}: {cleanup_error}")
+                        os.unlink(temp_path)
+                        logger.info("   • Eliminado: %s", os.path.basename(temp_path))
+                    except FileNotFoundError:
+                        pass
+                    except OSError as cleanup_error:
+                        logger.warning("   ⚠️ No se pudo eliminar %s: %s", os.path.basename(temp_path), cleanup_error)
 
             logger.info("")
             logger.info("✅ Proceso de envío de correos completado")
             return True
 
         except Exception as e:
-            logger.exception(f"❌ Error al enviar respuesta del caso: {str(e)}")
+            logger.exception("❌ Error al enviar respuesta del caso: %s", e)
             return False
\ No newline at end of file
@@ -38,19 +38,43 @@ class AsyncHelper:
         if self._started:
             return
 
+        # Cada arranque usa sus propios eventos: un thread que venció el plazo y arranca
+        # tarde no puede marcar como listo (ni reemplazar el loop de) un arranque posterior
+        ready = threading.Event()
+        abandoned = threading.Event()
+        created = []
+
         def run_loop():
             """Ejecuta el event loop"""
-            self._loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self._loop)
-            self._loop.run_forever()
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            created.append(loop)
+            ready.set()
+            if abandoned.is_set():
+                loop.close()
+                return
+            loop.run_forever()
 
         self._thread = threading.Thread(target=run_loop, daemon=True)
         self._thread.start()
         self._started = True
 
-        # Esperar a que el loop esté listo
-        while self._loop is None:
-            pass
+        # Esperar a que el loop esté listo (sin consumir CPU mientras tanto)
+        if not ready.wait(timeout=5.0):
+            # Sin loop no se puede quedar "iniciado": la próxima llamada debe reintentar.
+            # Si el thread alcanzó a crear el loop se detiene; si no, lo cierra él mismo.
+            abandoned.set()
+            if created:
+                try:
+                    created[0].call_soon_threadsafe(created[0].stop)
+                except RuntimeError:
+                    pass
+            self._started = False
+            self._thread = None
+            self._loop = None
+            raise RuntimeError("El event loop no se inició a tiempo")
+
+        self._loop = created[0]
 
     def run_async(self, coro) -> Any:
         """
@@ -60,7 +84,10 @@ class AsyncHelper:
             coro: Coroutine a ejecutar
             
         Returns:
-            Resultado de la coroutine
+            Resultado de la coroutine. Si se llama desde el propio loop
+            del helper (ej: un callback de run_async_callback), no se
+            puede bloquear sin deadlock: la coroutine se agenda con
+            asyncio.ensure_future y se retorna el asyncio.Task.
             
         Raises:
             Exception: Si la coroutine falla
@@ -68,6 +95,15 @@ class AsyncHelper:
         if not self._started:
             self.start_loop()
 
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self._loop:
+            # Mismo loop: agendar directo, sin saltar de thread
+            return asyncio.ensure_future(coro)
+
         # Crear future para obtener el resultado
         future = asyncio.run_coroutine_threadsafe(coro, self._loop)
 
@@ -3,6 +3,7 @@
 
 import logging
 import sys
+import time
 from pathlib import Path
 from typing import Optional, Callable
 from logging.handlers import RotatingFileHandler
@@ -65,41 +66,73 @@ class ContextLogger:
         new_context = {**self._context, **kwargs}
         return ContextLogger(self._name, new_context)
 
-    def debug(self, event: str, **kwargs):
+    def debug(self, event: str, *args, **kwargs):
         """Log nivel DEBUG"""
-        self._logger.debug(event, **kwargs)
+        self._logger.debug(event, *args, **kwargs)
         if _gui_callback:
-            _gui_callback(event, "DEBUG")
+            _gui_callback(_format_event(event, args), "DEBUG")
 
-    def info(self, event: str, **kwargs):
+    def info(self, event: str, *args, **kwargs):
         """Log nivel INFO"""
-        self._logger.info(event, **kwargs)
+        self._logger.info(event, *args, **kwargs)
         if _gui_callback:
-            _gui_callback(event, "INFO")
+            _gui_callback(_format_event(event, args), "INFO")
 
-    def warning(self, event: str, **kwargs):
+    def warning(self, event: str, *args, **kwargs):
         """Log nivel WARNING"""
-        self._logger.warning(event, **kwargs)
+        self._logger.warning(event, *args, **kwargs)
         if _gui_callback:
-            _gui_callback(event, "WARNING")
+            _gui_callback(_format_event(event, args), "WARNING")
 
-    def error(self, event: str, **kwargs):
+    def error(self, event: str, *args, **kwargs):
         """Log nivel ERROR"""
-        self._logger.error(event, **kwargs)
+        self._logger.error(event, *args, **kwargs)
         if _gui_callback:
-            _gui_callback(event, "ERROR")
+            _gui_callback(_format_event(event, args), "ERROR")
 
-    def critical(self, event: str, **kwargs):
+    def critical(self, event: str, *args, **kwargs):
         """Log nivel CRITICAL"""
-        self._logger.critical(event, **kwargs)
+        self._logger.critical(event, *args, **kwargs)
         if _gui_callback:
-            _gui_callback(event, "CRITICAL")
+            _gui_callback(_format_event(event, args), "CRITICAL")
 
-    def exception(self, event: str, exc_info=True, **kwargs):
+    def exception(self, event: str, *args, exc_info=True, **kwargs):
         """Log de excepción con traceback"""
-        self._logger.exception(event, exc_info=exc_info, **kwargs)
+        self._logger.exception(event, *args, exc_info=exc_info, **kwargs)
         if _gui_callback:
-            _gui_callback(event, "EXCEPTION")
+            _gui_callback(_format_event(event, args), "EXCEPTION")
+
+
+def _format_event(event: str, args: tuple) -> str:
+    """
+    Aplica el formateo estilo %% solo cuando hay argumentos posicionales
+
+    Permite llamadas perezosas como logger.error("Error: %s", e): structlog interpola
+    los argumentos solo si el nivel está habilitado, y la GUI recibe el texto final.
+    """
+    return event % args if args else event
+
+
+# Último segundo formateado por add_cached_timestamp: (segundo, texto)
+_timestamp_cache = (0, "")
+
+
+def add_cached_timestamp(logger, method_name: str, event_dict: EventDict) -> EventDict:
+    """
+    Processor que agrega 'timestamp' (UTC, "%Y-%m-%d %H:%M:%S") como TimeStamper
+
+    El texto se formatea una vez por segundo y se reutiliza: en ráfagas de cientos de
+    líneas se evita un strftime por línea.
+    """
+    global _timestamp_cache
+    now = int(time.time())
+    second, text = _timestamp_cache
+    if now != second:
+        text = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now))
+        # Tupla completa en una sola asignación: otro hilo nunca ve segundo y texto mezclados
+        _timestamp_cache = (now, text)
+    event_dict["timestamp"] = text
+    return event_dict
 
 
 def add_app_context(logger, method_name: str, event_dict: EventDict) -> EventDict:
@@ -176,7 +209,7 @@ def setup_logging(
             structlog.processors.add_log_level,
             structlog.processors.StackInfoRenderer(),
             structlog.dev.set_exc_info,
-            structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S"),
+            add_cached_timestamp,
             add_app_context,
             structlog.dev.ConsoleRenderer(colors=True)
         ]
@@ -37,6 +37,7 @@ from tkinter import ttk, messagebox, filedialog
 import tkinter.font as tkfont
 import threading
 import time
+from collections import deque
 from datetime import datetime
 from PIL import Image, ImageTk, ImageDraw
 
@@ -57,6 +58,17 @@ except ImportError as e:
     sys.exit(1)
 
 
+# Nivel de log → (tag, color) de los widgets de texto del log
+_LOG_TAGS = {
+    "ERROR": ("error", "#FF0000"),
+    "CRITICAL": ("critical", "#8B0000"),
+    "EXCEPTION": ("exception", "#DC143C"),
+    "WARNING": ("warning", "#FF8C00"),
+    "INFO": ("info", "#0066CC"),
+    "DEBUG": ("debug", "#808080"),
+}
+
+
 class IntegratedGUI(LoggerMixin):
     """Interfaz gráfica integrada para API y Correo"""
     WINDOW_WIDTH = 900
@@ -362,6 +374,10 @@ class IntegratedGUI(LoggerMixin):
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.log_text.config(yscrollcommand=scrollbar.set)
 
+        # Colores por nivel configurados una sola vez, no en cada línea de log
+        for tag, color in _LOG_TAGS.values():
+            self.log_text.tag_config(tag, foreground=color)
+
         # self.logger.set_text_widget(self.log_text)
 
     def setup_api_left_panel(self):
@@ -909,56 +925,68 @@ class IntegratedGUI(LoggerMixin):
     def setup_logger_gui_callback(self):
         """
         Configura el callback del logger para que los mensajes se muestren en la GUI
-        Este callback se ejecutará de forma thread-safe usando self.root.after()
+
+        Los mensajes (que pueden llegar desde otros hilos) se acumulan en una cola y
+        el hilo principal de Tkinter los escribe por lotes con self.root.after().
         """
+        self._gui_log_queue = deque()
+        self._gui_log_lock = threading.Lock()
+        self._gui_log_flush_pending = False
 
         def gui_callback(message: str, level: str):
             """
-            Callback que recibe mensajes del logger y los muestra en la GUI
-            Se ejecuta de forma thread-safe usando root.after()
+            Callback que recibe mensajes del logger y los encola para la GUI
+
+            Solo el primer mensaje de una ráfaga programa la escritura; los demás se
+            agregan a la misma cola y salen en el mismo lote.
             """
+            with self._gui_log_lock:
+                self._gui_log_queue.append((message, level))
+                if self._gui_log_flush_pending:
+                    return
+                self._gui_log_flush_pending = True
+
             # Usar root.after para ejecutar en el hilo principal de Tkinter
             # Esto es necesario porque el logger puede llamarse desde otros hilos
             try:
-                self.root.after(0, self._write_log_to_gui, message, level)
+                self.root.after(0, self._flush_logs_to_gui)
             except Exception:
-                # Si hay algún error (ej: la ventana se cerró), ignorarlo
-                pass
+                # Si hay algún error (ej: la ventana se está cerrando) no quedó ninguna
+                # escritura programada: se libera la marca para que el próximo mensaje
+                # vuelva a intentarlo en lugar de quedar encolado para siempre
+                with self._gui_log_lock:
+                    self._gui_log_flush_pending = False
 
         # Configurar el callback global del logger
         set_gui_callback(gui_callback)
 
-    def _write_log_to_gui(self, message: str, level: str):
+    def _flush_logs_to_gui(self):
         """
-        Escribe un mensaje del logger en los widgets de texto de la GUI
+        Escribe en el log del sistema todos los mensajes encolados por el logger
+
+        Un solo insert con los pares (texto, tag) del lote y un solo cambio de estado
+        y scroll del widget, en lugar de uno por mensaje.
         DEBE ejecutarse en el hilo principal de Tkinter
         """
+        with self._gui_log_lock:
+            pending = list(self._gui_log_queue)
+            self._gui_log_queue.clear()
+            self._gui_log_flush_pending = False
+
+        if not pending:
+            return
+
+        chunks = []
+        for message, level in pending:
+            chunks.append(f"{message}\n")
+            chunks.append(_LOG_TAGS.get(level, _LOG_TAGS["DEBUG"])[0])
+
         try:
             # Habilitar edición temporal
             self.log_text.config(state=tk.NORMAL)
 
-            # Configurar color según nivel
-            if level == "ERROR":
-                tag = "error"
-                self.log_text.tag_config(tag, foreground="#FF0000")
-            elif level == "CRITICAL":
-                tag = "critical"
-                self.log_text.tag_config(tag, foreground="#8B0000")
-            elif level == "EXCEPTION":
-                tag = "exception"
-                self.log_text.tag_config(tag, foreground="#DC143C")
-            elif level == "WARNING":
-                tag = "warning"
-                self.log_text.tag_config(tag, foreground="#FF8C00")
-            elif level == "INFO":
-                tag = "info"
-                self.log_text.tag_config(tag, foreground="#0066CC")
-            else:  # DEBUG
-                tag = "debug"
-                self.log_text.tag_config(tag, foreground="#808080")
-
-            # Agregar mensaje al log del sistema
-            self.log_text.insert(tk.END, f"{message}\n", tag)
+            # Agregar el lote al log del sistema
+            self.log_text.insert(tk.END, *chunks)
 
             # Scroll al final
             self.log_text.see(tk.END)
@@ -977,7 +1005,7 @@ class IntegratedGUI(LoggerMixin):
 
         modal = tk.Toplevel(self.root)
         modal.title("Configuración de Correo")
-        modal.geometry("400x250")
+        modal.geometry("400x280")
         modal.transient(self.root)
         modal.grab_set()
         modal.focus_set()
@@ -1010,6 +1038,11 @@ class IntegratedGUI(LoggerMixin):
         password_entry = ttk.Entry(config_frame, textvariable=password_var, show="*")
         password_entry.grid(row=2, column=1, sticky="ew", padx=5, pady=5)
 
+        # Solo el envío va por el MTA local; el monitoreo sigue usando el IMAP del proveedor
+        local_relay_var = tk.BooleanVar(value=config.get('smtp_local_relay', False))
+        ttk.Checkbutton(config_frame, text="Enviar por MTA local (127.0.0.1:25)",
+                        variable=local_relay_var).grid(row=3, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+
         button_frame = ttk.Frame(config_frame)
         button_frame.grid(row=4, column=0, columnspan=2, sticky="ew", pady=20)
 
@@ -1023,8 +1056,9 @@ class IntegratedGUI(LoggerMixin):
                 return
 
             self.log_api_message("Probando conexión SMTP e IMAP...")
-            smtp_result = self.email_manager.test_smtp_connection(provider, email, password)
-            imap_result = self.email_manager.test_imap_connection(provider, email, password)
+            smtp_result = self.email_manager.test_smtp_connection(provider, email, password, self.logger,
+                                                                  local_relay=local_relay_var.get())
+            imap_result = self.email_manager.test_imap_connection(provider, email, password, self.logger)
 
             if smtp_result and imap_result:
                 self.log_api_message(f"✅ Conexión exitosa a {provider} (SMTP e IMAP)", level="INFO")
@@ -1041,7 +1075,8 @@ class IntegratedGUI(LoggerMixin):
             current_config.update({
                 'provider': provider_var.get(),
                 'email': email_var.get(),
-                'password': password_var.get()
+                'password': password_var.get(),
+                'smtp_local_relay': local_relay_var.get()
             })
 
             if not all([current_config['provider'], current_config['email'], current_config['password']]):
@@ -2504,6 +2539,8 @@ class IntegratedGUI(LoggerMixin):
                 if search_params.get('caso1', '').strip():
                     search_titles.append(search_params['caso1'].strip())
 
+                self.email_manager.use_local_relay = config.get('smtp_local_relay', False)
+
                 if search_titles or allowed_domains:
                     self.log_api_message(f"Revisando correos... ({datetime.now().strftime('%H:%M:%S')})")
 
@@ -2517,7 +2554,16 @@ class IntegratedGUI(LoggerMixin):
                         allowed_domains  # Pasar dominios permitidos
                     )
 
-                time.sleep(30)
+                    # Espera con IMAP IDLE: si llega correo antes de los 30 s se revisa de inmediato
+                    self.email_manager.idle_and_wait(
+                        config['provider'],
+                        config['email'],
+                        config['password'],
+                        self.logger,
+                        timeout=30
+                    )
+                else:
+                    time.sleep(30)
 
             except Exception as e:
                 self.log_api_message(f"❌ Error en el monitoreo: {str(e)}", level="ERROR")
@@ -3020,7 +3066,7 @@ class IntegratedGUI(LoggerMixin):
             self.api_log_text.tag_config(tag, foreground="#8B0000")
             self.log_text.tag_config(tag, foreground="#8B0000")
         elif level == "EXCEPTION":
-            self.logger.exception(message, exc_info, **kwargs)
+            self.logger.exception(message, exc_info=exc_info, **kwargs)
             tag = "exception"
             self.api_log_text.tag_config(tag, foreground="#DC143C")
             self.log_text.tag_config(tag, foreground="#DC143C")
@@ -3075,14 +3121,18 @@ class IntegratedGUI(LoggerMixin):
                 self.monitoring = False
                 time.sleep(1)
 
-                # Detener async helper
+                # Detener async helper y cerrar las conexiones SMTP/IMAP reutilizadas
                 self.async_helper.stop_loop()
+                if self.email_manager:
+                    self.email_manager.close_all()
 
                 self.root.quit()
                 self.root.destroy()
         else:
-            # Detener async helper
+            # Detener async helper y cerrar las conexiones SMTP/IMAP reutilizadas
             self.async_helper.stop_loop()
+            if self.email_manager:
+                self.email_manager.close_all()
 
             self.root.quit()
             self.root.destroy()
@@ -3739,9 +3789,13 @@ El preingreso se ha creado correctamente en nuestro sistema.
 Este es un correo automático del sistema de preingresos.
 """
 
-        # Enviar correos individuales
-        from email_manager import EmailManager
-        email_manager = EmailManager()
+        # Enviar correos individuales con el gestor de la aplicación: sus conexiones SMTP
+        # se reutilizan y se cierran con close_all() al salir
+        email_manager = self.email_manager
+        if email_manager is None:
+            self.log_api_message("❌ El gestor de correo no está inicializado", level="ERROR")
+            return
+        email_manager.use_local_relay = email_config.get('smtp_local_relay', False)
 
         for destinatario in cc_users:
             try: